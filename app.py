@@ -1,12 +1,17 @@
+import os
 import streamlit as st
-import preprocessor
+import archives
 import helper
-from ui.components import render_header, render_sidebar, render_stats_section, render_analysis_sections
+from config.settings import UPLOAD_CONFIG
+from ui.cache import content_hash, load_chat, load_archive, cached_call
+from ui.components import render_header, render_sidebar, render_stats_section, render_analysis_sections, render_performance_panel
 from ui.styles import apply_custom_css
-import pdf_generator
+from ui import profiling
 
 st.set_page_config(layout='wide', page_title="WhatsStat - WhatsApp Chat Analyzer")
 
+profiling.start_run()
+
 apply_custom_css()
 
 render_sidebar()
@@ -17,31 +22,42 @@ st.markdown("### 📂 Upload your chat or Try Demo")
 
 col1, col2 = st.columns([1, 1])
 
-data = None
+chat = None
 
 use_demo = st.checkbox("👉 Try with Demo Data (No upload needed)")
 
-uploaded_file = st.file_uploader("Choose a WhatsApp chat file (.txt)", type="txt")
+uploaded_file = st.file_uploader("Choose a WhatsApp chat file (.txt, or the .zip / .gz it was shared as)",
+                                 type=UPLOAD_CONFIG['allowed_extensions'])
 
 if use_demo:
     try:
-        with open("sample_chat.txt", "r", encoding="utf-8") as f:
-            data = f.read()
+        with open("sample_chat.txt", "rb") as f:
+            chat = load_chat(content_hash(f), f)
     except FileNotFoundError:
         st.error("Demo file 'sample_chat.txt' not found. Please upload a file.")
 
-elif uploaded_file is not None:
-    bytes_data = uploaded_file.getvalue()
-    data = bytes_data.decode("utf-8")
+elif uploaded_file is not None and archives.is_archive(uploaded_file.name):
+    try:
+        chats = load_archive(content_hash(uploaded_file), uploaded_file, uploaded_file.name)
+    except archives.ARCHIVE_ERRORS:
+        chats = None
+    if chats is None:
+        st.error("This archive could not be read. Please upload the .zip or .gz WhatsApp shared.")
+    elif not chats:
+        st.error("No chat (.txt) found in this archive.")
+    elif len(chats) == 1:
+        chat = next(iter(chats.values()))
+    else:
+        member = st.selectbox("💬 Chat in this archive", list(chats),
+                              format_func=lambda name: os.path.splitext(os.path.basename(name))[0])
+        chat = chats[member]
 
-if data is not None:
-    df = preprocessor.preprocess(data)
+elif uploaded_file is not None:
+    # Parsed once per file content; reruns and re-uploads of the same file hit the cache
+    chat = load_chat(content_hash(uploaded_file), uploaded_file)
 
-    user_list = df['user'].unique().tolist()
-    if 'group_notification' in user_list:
-        user_list.remove('group_notification')
-    user_list.sort()
-    user_list.insert(0, "Overall")
+if chat is not None:
+    user_list = ["Overall"] + chat.users
 
     st.markdown("---")
     selected_user = st.selectbox("🧐 Analyze chat for", user_list)
@@ -67,18 +83,19 @@ if data is not None:
     st.markdown('</div>', unsafe_allow_html=True)
 
     if st.session_state.analysis_done:
-        render_stats_section(selected_user, df)
-        render_analysis_sections(selected_user, df)
+        render_stats_section(selected_user, chat)
+        render_analysis_sections(selected_user, chat)
 
         st.markdown("---")
         st.subheader("📥 Export Report")
         
         if st.button("📄 Generate PDF Report"):
-            
-            num_messages, words, num_media, num_links = helper.fetch_stats(selected_user, df)
-            most_busy_users = helper.most_busy_users(df)
-            emoji_df = helper.emoji_helper(selected_user, df)
-            daily_timeline = helper.daily_timeline(selected_user, df)
+            import pdf_generator
+
+            num_messages, words, num_media, num_links = cached_call(helper.fetch_stats, selected_user, chat)
+            most_busy_users = cached_call(helper.most_busy_users, chat)
+            emoji_df = cached_call(helper.emoji_helper, selected_user, chat)
+            daily_timeline = cached_call(helper.daily_timeline, selected_user, chat)
             
           
             pdf_bytes = pdf_generator.create_pdf(
@@ -94,6 +111,8 @@ if data is not None:
                 mime="application/pdf"
             )
         
+if profiling.enabled():
+    render_performance_panel()
 
 st.markdown("""
 <hr style="margin-top: 50px; border: none; border-top: 2px solid #25D366;" />
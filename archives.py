@@ -0,0 +1,159 @@
+# archives.py
+# Zipped exports. WhatsApp's "Export chat" shares a .zip holding the chat as a
+# .txt (plus any attached media), and people also upload .gz files or zips of
+# several chats. Members are decompressed in a stream straight into the chunked
+# parser, never extracted whole, and only once. Each member is cached under
+# the archive's hash and its name, so a cached archive is never decompressed
+# again.
+import gzip
+import hashlib
+import multiprocessing
+import os
+import posixpath
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import chat_cache
+import preprocessor
+from helper.chat_index import ChatIndex
+
+ARCHIVE_EXTENSIONS = ('.zip', '.gz')
+
+# Raised for corrupt or truncated archives (gzip.BadGzipFile is an OSError)
+ARCHIVE_ERRORS = (zipfile.BadZipFile, OSError, EOFError)
+
+
+def is_archive(name):
+    return name.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def chat_members(file, name):
+    """Names of the chat exports in an archive, in archive order"""
+    if name.lower().endswith('.gz'):
+        # A gzip file holds one member, named after the file
+        return [posixpath.basename(name.replace(os.sep, '/'))[:-3]]
+
+    file.seek(0)
+    with zipfile.ZipFile(file) as archive:
+        return [
+            info.filename for info in archive.infolist()
+            if not info.is_dir()
+            and info.filename.lower().endswith('.txt')
+            # macOS adds resource forks of every file under __MACOSX/
+            and not info.filename.startswith('__MACOSX/')
+            and not posixpath.basename(info.filename).startswith('.')
+        ]
+
+
+@contextmanager
+def open_member(file, name, member):
+    """A binary stream of one member, decompressed as it is read"""
+    file.seek(0)
+    if name.lower().endswith('.gz'):
+        with gzip.GzipFile(fileobj=file, mode='rb') as stream:
+            yield stream
+    else:
+        with zipfile.ZipFile(file) as archive, archive.open(member) as stream:
+            yield stream
+
+
+def member_digest(archive_digest, member):
+    """Cache key of one chat in an archive with content hash `archive_digest`"""
+    return hashlib.sha256(f"{archive_digest}\0{member}".encode('utf-8')).hexdigest()
+
+
+class _Measured:
+    # Passes reads through, keeping the size and hashes of what was read: the
+    # export meta the disk cache stores, gathered while the member is parsed
+    # since it can't be rewound cheaply. The sha256 of the text lets a later
+    # .txt export that extends this chat find it (chat_cache.find_base).
+    def __init__(self, stream):
+        self.stream = stream
+        self.size = 0
+        self._head = hashlib.md5()
+        self._sha = hashlib.sha256()
+
+    def read(self, size=-1):
+        block = self.stream.read(size)
+        if self.size < chat_cache.HEAD_BYTES:
+            self._head.update(block[:chat_cache.HEAD_BYTES - self.size])
+        self._sha.update(block)
+        self.size += len(block)
+        return block
+
+    def meta(self):
+        return {'size': self.size, 'head': self._head.hexdigest(), 'sha256': self._sha.hexdigest()}
+
+
+def _parse(stream, digest):
+    measured = _Measured(stream)
+    df = preprocessor.preprocess_stream(measured)
+    return ChatIndex(df, digest=digest), measured.meta()
+
+
+def _parse_member(path, name, member, digest):
+    # Runs in a worker process, which opens the archive itself
+    with open(path, 'rb') as file, open_member(file, name, member) as stream:
+        return _parse(stream, digest)
+
+
+@contextmanager
+def _on_disk(file):
+    # Worker processes open the archive by path; uploads only live in memory
+    try:
+        file.fileno()
+        on_disk = True
+    except (AttributeError, OSError):  # io.UnsupportedOperation is an OSError
+        on_disk = False
+    if on_disk:
+        yield file.name
+        return
+
+    with tempfile.NamedTemporaryFile(suffix='.archive', delete=False) as spool:
+        file.seek(0)
+        shutil.copyfileobj(file, spool, 1 << 20)
+    try:
+        yield spool.name
+    finally:
+        os.unlink(spool.name)
+
+
+def load_members(file, name, digest=None, workers=None):
+    """Parse every chat in an archive into {member: ChatIndex}, through the
+    disk cache. `digest` is the archive's content hash, worked out if not
+    given. Members that need parsing are parsed in parallel, one worker process
+    each, up to `workers` (default: one per CPU)."""
+    digest = digest or chat_cache.content_hash(file)
+    members = chat_members(file, name)
+    chats = {}
+    todo = {}
+    for member in members:
+        key = member_digest(digest, member)
+        chat = chat_cache.load(key)
+        if chat is None:
+            todo[member] = key
+        else:
+            chats[member] = chat
+
+    workers = min(workers or os.cpu_count() or 1, len(todo))
+    if workers > 1:
+        # Spawned, not forked: the web app calls this from a threaded server
+        context = multiprocessing.get_context('spawn')
+        with _on_disk(file) as path, ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {member: pool.submit(_parse_member, path, name, member, key)
+                       for member, key in todo.items()}
+            parsed = {member: future.result() for member, future in futures.items()}
+    else:
+        parsed = {}
+        for member, key in todo.items():
+            with open_member(file, name, member) as stream:
+                parsed[member] = _parse(stream, key)
+
+    for member, (chat, meta) in parsed.items():
+        chat_cache.save(chat, None, meta=meta)
+        chats[member] = chat
+    # Archive order, whichever members came from the cache
+    return {member: chats[member] for member in members}
@@ -0,0 +1,136 @@
+"""Transient memory of every helper, and proof that none of them grows the chat.
+
+Runs all helpers for the whole chat and for its busiest user a few times, as
+reruns of the dashboard would, and reports each helper's peak traced
+allocation. Fails if any helper changes the shared frame's columns or size.
+The helpers that used to add columns to the frame are also run in their old
+form, the baseline code, for comparison. Their new form reads the chat's
+shared tables, which are built once beforehand and not counted.
+
+    python benchmarks/bench_memory.py --messages 200000 --reruns 3
+"""
+import argparse
+import io
+import os
+import sys
+import tracemalloc
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import helper
+import preprocessor
+from config.settings import DISK_CACHE_CONFIG
+from bench_suite import HELPERS
+from synthetic import generate_chat
+
+# Slow pure-Python helpers whose memory doesn't depend on the frame layout
+SLOW = {'create_wordcloud', 'wordcloud_png', 'detect_languages'}
+
+
+def legacy_longest_message_sender(df):
+    df['message_length'] = df['message'].apply(len)
+    df_filtered = df[df['user'] != 'group_notification']
+    longest_msg = df_filtered.loc[df_filtered['message_length'].idxmax()]
+    return longest_msg['user'], longest_msg['message'], longest_msg['message_length']
+
+
+def legacy_trending_topics_by_month(df):
+    # The baseline version, with the stop-word file found from any directory
+    with open(os.path.join(ROOT, 'stop_hinglish.txt'), 'r') as f:
+        stop_words = f.read()
+
+    df['month_year'] = df['date'].dt.to_period('M')
+    df = df[df['message'] != '<Media omitted>']
+    df = df[df['user'] != 'group_notification']
+
+    result = {}
+
+    for period, group in df.groupby('month_year'):
+        words = []
+        for msg in group['message']:
+            for word in msg.lower().split():
+                if word not in stop_words:
+                    words.append(word)
+        common = Counter(words).most_common(10)
+        result[str(period)] = dict(common)
+
+    return result
+
+
+def legacy_language_candidates(df):
+    temp = df[(df['user'] != 'group_notification') & (df['message'] != '<Media omitted>')]
+    return temp[temp['message'].str.len() > 20]
+
+
+def peak_of(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def frame_state(df):
+    return list(df.columns), int(df.memory_usage(deep=False).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200_000)
+    parser.add_argument('--reruns', type=int, default=3)
+    parser.add_argument('--include-slow', action='store_true', help="also run the word cloud and language detection")
+    args = parser.parse_args()
+    # Time the work itself, not languages stored by an earlier run
+    DISK_CACHE_CONFIG['enabled'] = False
+
+    df = preprocessor.preprocess_stream(io.StringIO(generate_chat(args.messages)))
+    chat = helper.ChatIndex(df)
+    # Build the shared tables first; they are created once per chat, not per render
+    for name in ('cube', 'tokens', 'token_counts', 'month_token_counts', 'month_token_ranking', 'emojis', 'emoji_counts', 'polarity', 'timeline'):
+        getattr(chat, name)
+    busiest = helper.most_busy_users(chat)[0].index[0]
+
+    before = frame_state(chat.df)
+    print(f"frame: {len(chat.df):,} rows, {before[1] / 2**20:.1f} MB, {len(before[0])} columns\n")
+
+    changed = []
+    peaks = {}
+    for rerun in range(args.reruns):
+        for func, per_user in HELPERS:
+            if func.__name__ in SLOW and not args.include_slow:
+                continue
+            calls = [('Overall', lambda: func('Overall', chat)), ('user', lambda: func(busiest, chat))] if per_user \
+                else [(None, lambda: func(chat))]
+            for who, call in calls:
+                name = func.__name__ + (f'[{who}]' if who else '')
+                peaks[name] = max(peaks.get(name, 0), peak_of(call))
+                if frame_state(chat.df) != before:
+                    changed.append(f"{name} (rerun {rerun + 1})")
+                    before = frame_state(chat.df)
+
+    print(f"{'helper':<40}{'peak MB':>10}")
+    for name, peak in peaks.items():
+        print(f"{name:<40}{peak / 2**20:10.2f}")
+
+    print(f"\n{'previously copying version':<40}{'old MB':>10}{'new MB':>10}")
+    comparisons = [
+        ('longest_message_sender', lambda: legacy_longest_message_sender(chat.df.copy(deep=False)),
+         lambda: helper.longest_message_sender(chat)),
+        ('trending_topics_by_month', lambda: legacy_trending_topics_by_month(chat.df.copy(deep=False)),
+         lambda: helper.trending_topics_by_month(chat)),
+        ('language candidates', lambda: legacy_language_candidates(chat.df),
+         lambda: chat.df[chat.df['message_length'] > 20]),
+    ]
+    for name, old, new in comparisons:
+        print(f"{name:<40}{peak_of(old) / 2**20:10.2f}{peak_of(new) / 2**20:10.2f}")
+
+    if changed:
+        print(f"\nFAIL: the shared frame changed in {', '.join(changed)}", file=sys.stderr)
+        sys.exit(1)
+    print(f"\nthe shared frame was unchanged after {args.reruns} render passes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Compare preprocessor.preprocess against the previous three-pass parser
+(re.split + re.findall + a per-message re.split for the user name).
+
+    python benchmarks/bench_preprocess.py --messages 200000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import preprocessor
+
+
+def legacy_preprocess(data):
+    data = data.replace('\u202f', ' ')
+    pattern = r'\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}(?:\s[APap][Mm])?\s-\s'
+
+    messages = re.split(pattern, data)[1:]
+    dates = re.findall(pattern, data)
+
+    df = pd.DataFrame({'user_message': messages, 'message_date': dates})
+    df['message_date'] = df['message_date'].str.replace(' - ', '')
+    df['message_date'] = pd.to_datetime(df['message_date'], format='mixed', dayfirst=False)
+    df.rename(columns={'message_date': 'date'}, inplace=True)
+
+    users = []
+    message_texts = []
+    for message in df['user_message']:
+        entry = re.split(r'([\w\W]+?):\s', message)
+        if len(entry) >= 3:
+            users.append(entry[1])
+            message_texts.append(" ".join(entry[2:]))
+        else:
+            users.append('group_notification')
+            message_texts.append(entry[0])
+
+    df['user'] = users
+    df['message'] = message_texts
+    df.drop(columns=['user_message'], inplace=True)
+
+    df['only_date'] = df['date'].dt.date
+    df['year'] = df['date'].dt.year
+    df['month_num'] = df['date'].dt.month
+    df['month'] = df['date'].dt.month_name()
+    df['day'] = df['date'].dt.day
+    df['day_name'] = df['date'].dt.day_name()
+    df['hour'] = df['date'].dt.hour
+
+    period = []
+    for hour in df['hour']:
+        if hour == 23:
+            period.append(f"{hour}-00")
+        elif hour == 0:
+            period.append("00-1")
+        else:
+            period.append(f"{hour}-{hour+1}")
+    df['period'] = period
+    return df
+
+
+def make_chat(num_messages, seed=0):
+    rng = random.Random(seed)
+    users = ['Alice', 'Bob', 'Charlie', 'Dev', '+91 98765 43210']
+    words = ['hello', 'ok', 'haha', 'see', 'you', 'tomorrow', 'trip', 'plan', 'done', 'lol']
+    lines = []
+    for _ in range(num_messages):
+        stamp = (f"{rng.randint(1, 12)}/{rng.randint(1, 28)}/24, "
+                 f"{rng.randint(1, 12)}:{rng.randint(0, 59):02d} {rng.choice(['AM', 'PM'])}")
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(1, 15)))
+        lines.append(f"{stamp} - {rng.choice(users)}: {text}\n")
+    return "".join(lines)
+
+
+def best_of(func, data, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    data = make_chat(args.messages)
+    legacy = best_of(legacy_preprocess, data, args.repeat)
+    current = best_of(preprocessor.preprocess, data, args.repeat)
+
+    print(f"messages:   {args.messages:,}")
+    print(f"legacy:     {legacy:.3f}s")
+    print(f"preprocess: {current:.3f}s")
+    print(f"speedup:    {legacy / current:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
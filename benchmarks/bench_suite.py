@@ -0,0 +1,224 @@
+"""Time every parsing stage and helper on synthetic exports of growing size.
+
+For each size and layout, records wall time and peak traced allocation of the
+preprocess stages, of building the ChatIndex and its tables, and of every
+helper for the whole chat and for its busiest user. Results are written as
+JSON; pass an earlier run with --compare to print the change per step.
+
+    python benchmarks/bench_suite.py --sizes 10k,100k,1M --output before.json
+    python benchmarks/bench_suite.py --sizes 10k,100k,1M --compare before.json
+
+10M messages needs several GB of memory. Times are the best of --repeat runs
+without tracing; peaks come from one extra run under tracemalloc, which only
+sees allocations made through Python and numpy and slows pure-Python steps
+such as language detection a lot. Use --no-memory for quick timing runs.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import helper
+import preprocessor
+from helper import langdetect_utils
+from config.settings import DISK_CACHE_CONFIG
+from synthetic import FORMATS, generate_chat
+
+# Tables ChatIndex builds on first use, in dependency order
+TABLES = ['cube', 'tokens', 'token_counts', 'month_token_counts', 'emojis', 'emoji_counts', 'polarity']
+
+# (helper, takes a selected user)
+HELPERS = [
+    (helper.fetch_stats, True),
+    (helper.most_busy_users, False),
+    (helper.longest_message_sender, False),
+    (helper.conversation_starter, False),
+    (helper.conversation_starters, False),
+    (helper.session_stats, False),
+    (helper.monthly_timeline, True),
+    (helper.daily_timeline, True),
+    (helper.week_activity_map, True),
+    (helper.month_activity_map, True),
+    (helper.activity_heatmap, True),
+    (helper.most_active_hour_heatmap, True),
+    (helper.most_common_words, True),
+    (helper.create_wordcloud, True),
+    (helper.wordcloud_png, True),
+    (helper.emoji_helper, True),
+    (helper.sentiment_analysis, True),
+    (helper.detect_languages, True),
+    (helper.trending_topics_by_month, False),
+    (helper.rising_topics_by_month, False),
+]
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+
+def measure(func, repeat, trace_memory, setup=None):
+    """(best seconds, peak traced bytes or None, result of the last call)"""
+    best = float('inf')
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    peak = None
+    if trace_memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def split_messages(text):
+    # The header scan of iter_preprocess, without chunking. The text is scanned
+    # as is; only the captured dates are normalised, in _build_frame.
+    is_ios = preprocessor._is_ios(text)
+    pattern = preprocessor.IOS_PATTERN if is_ios else preprocessor.ANDROID_PATTERN
+    matches = list(pattern.finditer(text))
+    ends = [match.start() for match in matches[1:]] + [len(text)]
+    dates = [match.group('date') for match in matches]
+    messages = [text[match.end():end] for match, end in zip(matches, ends)]
+    return is_ios, dates, messages
+
+
+def _drop_table(chat, name):
+    # The next access rebuilds the cached table
+    def setup():
+        chat.__dict__.pop(name, None)
+        if name == 'cube':
+            chat._cube = None
+            chat.__dict__.pop('_cube_rows', None)
+        if name == 'month_token_counts':
+            chat.__dict__.pop('month_token_ranking', None)
+            chat.__dict__.pop('month_bounds', None)
+            chat._trends.clear()
+    return setup
+
+
+def run_chat(size, fmt, repeat, trace_memory):
+    results = []
+
+    def record(stage, func, setup=None, rows=None):
+        try:
+            seconds, peak, result = measure(func, repeat, trace_memory, setup)
+        except Exception as e:
+            results.append({'size': size, 'format': fmt, 'stage': stage, 'error': f"{type(e).__name__}: {e}"})
+            return None
+        results.append({'size': size, 'format': fmt, 'stage': stage, 'seconds': round(seconds, 6),
+                        'peak_bytes': peak, 'rows': rows})
+        print(f"{size:>10,} {fmt:<8} {stage:<40} {seconds:9.3f}s"
+              + (f" {peak / 2**20:9.1f} MB" if peak is not None else ''), flush=True)
+        return result
+
+    start = time.perf_counter()
+    text = generate_chat(size, fmt)
+    print(f"{size:>10,} {fmt:<8} generated {len(text) / 2**20:.1f} MB in {time.perf_counter() - start:.1f}s", flush=True)
+
+    # preprocess, stage by stage
+    is_ios, dates, messages = record('preprocess.split_messages', lambda: split_messages(text), rows=size)
+    date_format = record('preprocess.detect_date_format', lambda: preprocessor.detect_date_format(dates, dayfirst=is_ios))
+    date_series = preprocessor._normalize_dates(dates)
+    record('preprocess.parse_dates', lambda: preprocessor._parse_dates(date_series, is_ios, date_format), rows=size)
+    message_series = pd.Series(messages, dtype=str)
+    record('preprocess.split_users', lambda: message_series.str.extract(preprocessor.USER_PATTERN), rows=size)
+    record('preprocess.build_frame', lambda: preprocessor._build_frame(dates, messages, is_ios, date_format), rows=size)
+    del date_series, message_series, dates, messages
+    df = record('preprocess', lambda: preprocessor.preprocess_stream(io.StringIO(text)), rows=size)
+    del text
+
+    # The index and the tables it builds lazily
+    chat = record('chat_index', lambda: helper.ChatIndex(df.copy()), rows=size)
+    for name in TABLES:
+        record(f'chat_index.{name}', lambda: getattr(chat, name), setup=_drop_table(chat, name))
+
+    busiest = helper.most_busy_users(chat)[0].index[0] if len(chat.users) else 'Overall'
+    for func, per_user in HELPERS:
+        setup = langdetect_utils._lang_cache.clear if func is helper.detect_languages else None
+        if per_user:
+            record(f'{func.__name__}[Overall]', lambda: func('Overall', chat), setup)
+            record(f'{func.__name__}[user]', lambda: func(busiest, chat), setup)
+        else:
+            record(func.__name__, lambda: func(chat), setup)
+
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before = {(r['size'], r['format'], r['stage']): r for r in baseline['results'] if 'seconds' in r}
+
+    print(f"\nchange against {baseline_path} ({baseline['meta'].get('commit')}):")
+    for r in results:
+        old = before.get((r['size'], r['format'], r['stage']))
+        if old is None or 'seconds' not in r or not old['seconds']:
+            continue
+        ratio = r['seconds'] / old['seconds']
+        flag = '  SLOWER' if ratio > 1.2 else ''
+        print(f"{r['size']:>10,} {r['format']:<8} {r['stage']:<40} {old['seconds']:9.3f}s -> {r['seconds']:9.3f}s  {ratio:5.2f}x{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10k,100k', help="comma separated message counts, e.g. 10k,100k,1M,10M")
+    parser.add_argument('--formats', default=','.join(FORMATS), help="comma separated: android, ios")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help="skip the tracemalloc run")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', metavar='BASELINE', help="an earlier --output file")
+    args = parser.parse_args()
+    # Time the work itself, not languages stored by an earlier run
+    DISK_CACHE_CONFIG['enabled'] = False
+
+    results = []
+    for size in (parse_size(size) for size in args.sizes.split(',')):
+        for fmt in args.formats.split(','):
+            results.extend(run_chat(size, fmt.strip(), args.repeat, args.memory))
+
+    meta = {
+        'commit': _commit(),
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.platform(),
+        'cpus': os.cpu_count(),
+        'repeat': args.repeat,
+    }
+    with open(args.output, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=1)
+    print(f"\nwrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
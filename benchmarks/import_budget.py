@@ -0,0 +1,85 @@
+"""Fail when importing the app's modules gets slow again.
+
+Each entry point is imported in a fresh interpreter that has already imported
+pandas, which every entry point needs anyway, and the import is timed there.
+The check fails if a dependency that should only load on first use is in
+sys.modules afterwards, or if the median import time over --repeat runs
+(after one warm-up run that writes the bytecode caches) is over --budget
+milliseconds. Exits 1 on a regression, so it can gate CI.
+
+    python benchmarks/import_budget.py --budget 150
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded by the helper that needs them, never at import
+LAZY = ['wordcloud', 'textblob', 'langdetect', 'urlextract', 'emoji', 'matplotlib']
+UI = ['streamlit', 'plotly', 'seaborn']
+
+# entry point -> top-level packages it must not load
+ENTRY_POINTS = {
+    'preprocessor': LAZY + UI,
+    'helper': LAZY + UI,
+    'chat_cache': LAZY + UI,
+    'cli': LAZY + UI,
+}
+
+
+# Run in a fresh interpreter: the time to import the module on top of pandas,
+# and the top-level packages loaded after it
+PROBE = """
+import json, sys, time
+import pandas
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'ms': seconds * 1000, 'loaded': sorted({{name.split('.')[0] for name in sys.modules}})}}))
+"""
+
+
+def import_profile(module):
+    """(milliseconds on top of pandas, set of top-level packages) for a cold import of module"""
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE.format(module=module)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    profile = json.loads(result.stdout.splitlines()[-1])
+    return profile['ms'], set(profile['loaded'])
+
+
+def median_of(module, repeat):
+    # The first run may compile .pyc files and read everything from disk
+    import_profile(module)
+    runs = [import_profile(module) for _ in range(repeat)]
+    return statistics.median(ms for ms, _ in runs), set.union(*(loaded for _, loaded in runs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=float, default=150, help="milliseconds allowed on top of pandas")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    failures = []
+    for module, forbidden in ENTRY_POINTS.items():
+        ms, loaded = median_of(module, args.repeat)
+        eager = sorted(loaded.intersection(forbidden))
+        print(f"{module:<14}{ms:8.1f} ms on top of pandas")
+        if ms > args.budget:
+            failures.append(f"{module} takes {ms:.1f} ms over pandas, budget is {args.budget:g} ms")
+        if eager:
+            failures.append(f"{module} imports {', '.join(eager)} at startup")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
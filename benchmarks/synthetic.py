@@ -0,0 +1,122 @@
+"""Deterministic synthetic WhatsApp exports for benchmarks.
+
+The same arguments always give the same export. Both layouts are supported:
+
+    android   1/14/24, 9:05 PM - Alice: text
+    ios       [14/01/24, 21:05:33] Alice: text
+
+    python benchmarks/synthetic.py --messages 1000000 --format ios chat.txt
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+FORMATS = ('android', 'ios')
+
+WORDS = [
+    'hello', 'ok', 'haha', 'see', 'you', 'tomorrow', 'trip', 'plan', 'done', 'lol',
+    'kal', 'milte', 'hai', 'kya', 'scene', 'bhai', 'yes', 'no', 'maybe', 'meeting',
+    'lunch', 'call', 'later', 'where', 'are', 'reached', 'home', 'thanks', 'great', 'sad',
+    'happy', 'good', 'bad', 'awesome', 'terrible', 'love', 'this', 'that', 'what', 'why',
+]
+EMOJI = ['😂', '❤️', '👍', '🙏', '😭', '🔥', '🎉', '😅', '👍🏽', '👨‍👩‍👧', '🇮🇳', '1️⃣']
+LINKS = ['https://example.com/a?b=1', 'www.example.org', 'http://t.co/xyz', 'docs.example.io/page']
+NOTIFICATIONS = [
+    'Messages and calls are end-to-end encrypted.',
+    '{user} added {other}',
+    '{user} changed the group description',
+    '{user} left',
+]
+MEDIA = {'android': '<Media omitted>', 'ios': '‎image omitted'}
+
+
+def make_users(count):
+    names = ['Alice', 'Bob', 'Charlie', 'Dev', 'Esha', 'Farhan', 'Gita', 'Hiro']
+    users = [names[i % len(names)] + ('' if i < len(names) else f' {i // len(names)}') for i in range(count)]
+    if count > 2:
+        users[-1] = '+91 98765 43210'  # unsaved contacts show up as phone numbers
+    return users
+
+
+def _stamp(when, fmt):
+    if fmt == 'ios':
+        return f"[{when:%d/%m/%y, %H:%M:%S}] "
+    hour = when.hour % 12 or 12
+    return f"{when.month}/{when.day}/{when:%y}, {hour}:{when:%M} {when:%p} - "
+
+
+def iter_lines(num_messages, fmt='android', users=8, emoji_density=0.1, link_density=0.02,
+               media_density=0.05, multiline_density=0.03, notification_density=0.01,
+               seed=0, start=datetime(2023, 1, 1)):
+    """Yield the export one message (possibly several lines) at a time"""
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt must be one of {FORMATS}")
+
+    rng = random.Random(seed)
+    names = make_users(users)
+    # A few people write most of the messages, as in real groups
+    weights = [1 / (rank + 1) for rank in range(len(names))]
+    when = start
+
+    for _ in range(num_messages):
+        # Mostly quick replies, now and then a quiet night
+        when += timedelta(seconds=int(rng.expovariate(1 / 600)))
+        user = rng.choices(names, weights)[0]
+
+        roll = rng.random()
+        if roll < notification_density:
+            text = rng.choice(NOTIFICATIONS).format(user=user, other=rng.choice(names))
+            yield f"{_stamp(when, fmt)}{text}\n"
+            continue
+        if roll < notification_density + media_density:
+            yield f"{_stamp(when, fmt)}{user}: {MEDIA[fmt]}\n"
+            continue
+
+        words = [rng.choice(WORDS) for _ in range(rng.randint(1, 20))]
+        if rng.random() < emoji_density:
+            words.insert(rng.randint(0, len(words)), ''.join(rng.choices(EMOJI, k=rng.randint(1, 3))))
+        if rng.random() < link_density:
+            words.append(rng.choice(LINKS))
+        if rng.random() < multiline_density:
+            cut = rng.randint(0, len(words))
+            words.insert(cut, '\n' + rng.choice(WORDS) + '\n')
+        yield f"{_stamp(when, fmt)}{user}: {' '.join(words)}\n"
+
+
+def generate_chat(num_messages, fmt='android', **options):
+    """The whole export as one string; see iter_lines for the options"""
+    return ''.join(iter_lines(num_messages, fmt, **options))
+
+
+def write_chat(path, num_messages, fmt='android', **options):
+    """Write the export to `path` without holding all of it in memory"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        batch = []
+        for line in iter_lines(num_messages, fmt, **options):
+            batch.append(line)
+            if len(batch) == 10_000:
+                f.write(''.join(batch))
+                batch = []
+        f.write(''.join(batch))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path')
+    parser.add_argument('--messages', type=int, default=100_000)
+    parser.add_argument('--format', choices=FORMATS, default='android')
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--emoji', type=float, default=0.1, help="share of messages with emoji")
+    parser.add_argument('--links', type=float, default=0.02, help="share of messages with a link")
+    parser.add_argument('--media', type=float, default=0.05, help="share of media messages")
+    parser.add_argument('--multiline', type=float, default=0.03, help="share of multi-line messages")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    write_chat(args.path, args.messages, args.format, users=args.users, emoji_density=args.emoji,
+               link_density=args.links, media_density=args.media, multiline_density=args.multiline,
+               seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+# chat_cache.py
+# Parsed chats on disk, so re-uploading a big export skips parsing. Each entry
+# is a directory named after the export's content hash and the parser version,
+# holding the message frame, the count cube and, once they have been built,
+# the per-user token and emoji counts, the per-month token counts and the
+# per-message sentiment as uncompressed Arrow (Feather) files that are memory-mapped on load, plus the
+# export's size and a hash of its first bytes so a later, longer export of the
+# same chat can be recognised, and the date layout it was read with.
+import hashlib
+import io
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import pandas as pd
+
+import preprocessor
+from config.settings import DISK_CACHE_CONFIG
+from helper.chat_index import ChatIndex
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # the cache is optional
+    pa = feather = None
+
+# Per-user count tables stored next to the cube, with their index columns
+COUNT_TABLES = {
+    'token_counts': ['user', 'token'],
+    'emoji_counts': ['user', 'emoji'],
+    'month_token_counts': ['month', 'token'],
+}
+
+# Bytes hashed to shortlist cached exports that a new upload might extend
+HEAD_BYTES = 1 << 16
+
+
+def _enabled():
+    return feather is not None and DISK_CACHE_CONFIG['enabled']
+
+
+def _entry_dir(digest):
+    return os.path.join(DISK_CACHE_CONFIG['directory'], f"{digest}-v{preprocessor.PARSER_VERSION}")
+
+
+def load(digest):
+    if not _enabled():
+        return None
+
+    path = _entry_dir(digest)
+    if not os.path.isdir(path):
+        return None
+
+    try:
+        df = _read(path, 'messages')
+        with open(os.path.join(path, 'meta.json')) as f:
+            df.attrs['date_format'] = json.load(f).get('date_format')
+        cube = _read(path, 'cube')
+        chat = ChatIndex(df, digest=digest, cube=cube)
+        for name, keys in COUNT_TABLES.items():
+            if os.path.exists(os.path.join(path, f'{name}.arrow')):
+                setattr(chat, name, _read(path, name).set_index(keys)['count'])
+        if os.path.exists(os.path.join(path, 'polarity.arrow')):
+            chat.polarity = _read(path, 'polarity')['polarity']
+    except Exception:
+        # Half-written or from an incompatible pyarrow; parse again instead
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+
+    # Eviction is oldest-first by mtime, so a hit counts as a fresh use
+    os.utime(path)
+    return chat
+
+
+def _read(path, name):
+    # Converted column by column, so numeric, date and categorical columns stay
+    # read-only views of the mapped file and strings stay Arrow-backed, instead
+    # of being copied into consolidated pandas blocks. Only single-chunk files
+    # (see _write) can be viewed like this; older entries are copied.
+    table = feather.read_table(os.path.join(path, f'{name}.arrow'), memory_map=True)
+    return pd.DataFrame({column: table[column].to_pandas() for column in table.column_names}, copy=False)
+
+
+def _write(path, name, df):
+    # One record batch per file, so every column is a single mappable buffer
+    table = pa.Table.from_pandas(df).combine_chunks()
+    feather.write_feather(table, os.path.join(path, f'{name}.arrow'), compression='uncompressed',
+                          chunksize=max(len(df), 1))
+
+
+def _file_size(file):
+    file.seek(0, io.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    return size
+
+
+@contextmanager
+def mapped(file):
+    """A read-only memory map of a binary file object. Uploads that only live
+    in memory are first spooled to a temporary file in blocks, so parsing
+    reads file-backed pages instead of another copy of the export."""
+    try:
+        file.fileno()
+        source = file
+    except (AttributeError, OSError):  # io.UnsupportedOperation is an OSError
+        source = tempfile.TemporaryFile()
+        file.seek(0)
+        shutil.copyfileobj(file, source, 1 << 20)
+        source.flush()
+        file.seek(0)
+
+    try:
+        if os.fstat(source.fileno()).st_size == 0:
+            # Empty files can't be mapped
+            yield io.BytesIO()
+        else:
+            with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                yield view
+    finally:
+        if source is not file:
+            source.close()
+
+
+def content_hash(file):
+    """Return the sha256 of a binary file object, read in chunks"""
+    file.seek(0)
+    sha = hashlib.sha256()
+    for block in iter(lambda: file.read(1 << 20), b''):
+        sha.update(block)
+    file.seek(0)
+    return sha.hexdigest()
+
+
+def _hash_prefix(file, size, algorithm='sha256'):
+    file.seek(0)
+    digest = hashlib.new(algorithm)
+    remaining = size
+    while remaining:
+        block = file.read(min(remaining, 1 << 20))
+        if not block:
+            break
+        digest.update(block)
+        remaining -= len(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def export_meta(file):
+    """Size and head hash of a binary export, as stored next to a cached chat"""
+    size = _file_size(file)
+    return {'size': size, 'head': _hash_prefix(file, min(size, HEAD_BYTES), 'md5')}
+
+
+def save(chat, file, meta=None):
+    # `file` is the binary export the chat was parsed from; exports that can't
+    # be re-read (archive members) pass their export_meta instead
+    if not _enabled() or chat.digest is None:
+        return
+
+    path = _entry_dir(chat.digest)
+    if os.path.isdir(path):
+        return
+
+    root = DISK_CACHE_CONFIG['directory']
+    os.makedirs(root, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=root, prefix='.tmp-')
+    try:
+        _write(tmp, 'messages', chat.df)
+        _write(tmp, 'cube', chat.cube)
+        _write_tables(tmp, chat)
+        if meta is None:
+            meta = export_meta(file)
+        # The layout the dates were read with, to read an appended tail the same way
+        meta = dict(meta, date_format=chat.df.attrs.get('date_format'))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        os.rename(tmp, path)
+    except Exception:
+        # Full disk, or a table pyarrow can't write; the chat just isn't cached
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+
+    evict(DISK_CACHE_CONFIG['max_size'] * 1024 * 1024)
+
+
+def save_tables(chat):
+    # Adds the tables built since the chat was saved to its cache entry, so
+    # the next load doesn't build them again
+    if not _enabled() or chat.digest is None:
+        return
+
+    path = _entry_dir(chat.digest)
+    if not os.path.isdir(path):
+        return
+    try:
+        _write_tables(path, chat)
+    except Exception:
+        # Same as in save; whatever was written stays, the rest is built on use
+        return
+
+
+def _write_tables(path, chat):
+    # Only tables already built. Building them here would tokenize the chat,
+    # extract its emojis and score its sentiment on upload, before any section
+    # is drawn. Each file is written under a temporary name and renamed, as
+    # another session may be adding the same table.
+    built = chat.__dict__
+    for name in [*COUNT_TABLES, 'polarity']:
+        if name not in built or os.path.exists(os.path.join(path, f'{name}.arrow')):
+            continue
+        if name == 'polarity':
+            df = chat.polarity.to_frame('polarity').reset_index(drop=True)
+        else:
+            df = getattr(chat, name).rename('count').reset_index()
+        _write(path, f'.tmp-{name}', df)
+        os.replace(os.path.join(path, f'.tmp-{name}.arrow'), os.path.join(path, f'{name}.arrow'))
+
+
+def find_base(file):
+    # The largest cached export that `file` starts with, as (digest, size), or
+    # (None, 0). Re-exports of a growing chat are the previous export plus the
+    # newest messages.
+    if not _enabled() or not os.path.isdir(DISK_CACHE_CONFIG['directory']):
+        return None, 0
+
+    size = _file_size(file)
+    suffix = f"-v{preprocessor.PARSER_VERSION}"
+    candidates = []
+    for name in os.listdir(DISK_CACHE_CONFIG['directory']):
+        if not name.endswith(suffix):
+            continue
+        try:
+            with open(os.path.join(DISK_CACHE_CONFIG['directory'], name, 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        # An empty export is a prefix of everything and has nothing to reuse
+        if 0 < meta['size'] < size:
+            digest = name[:-len(suffix)]
+            # Chats from archives are keyed by the archive, not by their text
+            candidates.append((meta['size'], meta['head'], meta.get('sha256', digest), digest))
+
+    heads = {}
+    for base_size, head, text_hash, digest in sorted(candidates, reverse=True):
+        head_size = min(base_size, HEAD_BYTES)
+        if head_size not in heads:
+            heads[head_size] = _hash_prefix(file, head_size, 'md5')
+        if heads[head_size] == head and _hash_prefix(file, base_size) == text_hash:
+            return digest, base_size
+    return None, 0
+
+
+def load_extension(file, digest):
+    # Parses only what `file` adds to a cached export it extends and merges it
+    # into that chat. None if there is no such export.
+    base_digest, offset = find_base(file)
+    if base_digest is None:
+        return None
+
+    file.seek(offset)
+    if not preprocessor.starts_with_message(file.read(4096).decode('utf-8', errors='ignore')):
+        # The old export doesn't end on a message boundary of the new one
+        return None
+
+    base = load(base_digest)
+    if base is None or not len(base):
+        # Like an empty export, one without messages (only a preamble) has
+        # nothing to reuse
+        return None
+
+    # Parse the tail with the layout the cached part was read with; a single
+    # day of messages may not be enough to tell day and month apart, and the
+    # start of the export may not be either
+    file.seek(offset)
+    tail = preprocessor.preprocess_stream(file, date_format=base.df.attrs.get('date_format'))
+    file.seek(0)
+
+    return base.extend(tail, digest=digest)
+
+
+def evict(max_bytes):
+    root = DISK_CACHE_CONFIG['directory']
+    if not os.path.isdir(root):
+        return
+
+    entries = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.startswith('.') or not os.path.isdir(path):
+            continue
+        size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+        entries.append((os.path.getmtime(path), size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
@@ -0,0 +1,271 @@
+# cli.py
+# Batch analysis without Streamlit: parses every export it is given in a pool
+# of worker processes and writes, per chat, a JSON summary of the helper
+# results, the PDF report and optionally the parsed messages as Parquet.
+#
+#   python cli.py exports/ --output results --workers 4 --memory-limit 2048
+#   python cli.py "exports/**/*.txt" --users all --parquet
+#   python cli.py exports/ --cache-dir /var/cache/whatsstat
+#
+# .zip and .gz exports are read too; an archive with several chats gets one
+# result directory per chat under the archive's name.
+#
+# Only preprocessor, helper, chat_cache and pdf_generator are imported here, so
+# worker startup doesn't pay for streamlit, plotly or seaborn.
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import archives
+import chat_cache
+import helper
+import pdf_generator
+import preprocessor
+from config.settings import ANALYSIS_CONFIG, DISK_CACHE_CONFIG
+
+# The app runs from the project directory; a relative cache directory is
+# taken from there too, so both share one cache wherever this is run from
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), DISK_CACHE_CONFIG['directory'])
+
+
+def find_exports(patterns):
+    """Expand directories and glob patterns into a sorted list of .txt, .zip and .gz files"""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for extension in ('.txt',) + archives.ARCHIVE_EXTENSIONS:
+                paths.update(glob.glob(os.path.join(pattern, '**', '*' + extension), recursive=True))
+            continue
+        paths.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+    return sorted(path for path in paths if os.path.isfile(path))
+
+
+def _init_worker(megabytes, cache_dir):
+    # Workers may be spawned rather than forked, so settings made in main()
+    # are passed in
+    DISK_CACHE_CONFIG['directory'] = cache_dir
+    _limit_memory(megabytes)
+
+
+def _limit_memory(megabytes):
+    # Runs in each worker, so a runaway chat kills its worker with MemoryError
+    # instead of the machine
+    if not megabytes:
+        return
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return
+    limit = megabytes * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _jsonable(value):
+    if isinstance(value, pd.DataFrame):
+        return json.loads(value.to_json(orient='records', date_format='iso'))
+    if isinstance(value, pd.Series):
+        return {str(key): _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (tuple, list)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _jsonable(item) for key, item in value.items()}
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if hasattr(value, 'item'):  # numpy scalars
+        return value.item()
+    return value
+
+
+def user_summary(selected_user, chat):
+    """Helper results for one user (or 'Overall') as plain JSON values"""
+    num_messages, words, num_media, num_links = helper.fetch_stats(selected_user, chat)
+    heatmap = helper.activity_heatmap(selected_user, chat)
+    return {
+        'stats': {
+            'messages': num_messages,
+            'words': words,
+            'media': num_media,
+            'links': num_links,
+        },
+        'monthly_timeline': helper.monthly_timeline(selected_user, chat),
+        'daily_timeline': helper.daily_timeline(selected_user, chat),
+        'week_activity': helper.week_activity_map(selected_user, chat),
+        'month_activity': helper.month_activity_map(selected_user, chat),
+        'activity_heatmap': {day: row for day, row in heatmap.iterrows()},
+        'common_words': helper.most_common_words(selected_user, chat),
+        'emojis': helper.emoji_helper(selected_user, chat).head(ANALYSIS_CONFIG['max_emojis_display']),
+        'sentiment': helper.sentiment_analysis(selected_user, chat),
+        # One process per chat already; don't fork a second pool inside it
+        'languages': helper.detect_languages(selected_user, chat, workers=1),
+    }
+
+
+def chat_summary(chat, users='overall'):
+    summary = {'users': chat.users, 'overall': user_summary('Overall', chat)}
+
+    _, percent = helper.most_busy_users(chat)
+    summary['most_busy_users'] = percent
+    if len(chat.users):
+        user, message, length = helper.longest_message_sender(chat)
+        summary['longest_message'] = {'user': user, 'message': message, 'length': length}
+    summary['conversation_starters'] = helper.conversation_starters(chat)
+    summary['sessions'] = helper.session_stats(chat)
+    summary['reply_seconds'] = helper.reply_times(chat)
+    summary['trending_topics'] = helper.trending_topics_by_month(chat, k=ANALYSIS_CONFIG['max_trending_topics'])
+    summary['rising_topics'] = helper.rising_topics_by_month(chat, k=ANALYSIS_CONFIG['max_trending_topics'],
+                                                             window_months=ANALYSIS_CONFIG['trend_window_months'])
+
+    if users == 'all':
+        summary['per_user'] = {user: user_summary(user, chat) for user in chat.users}
+    return _jsonable(summary)
+
+
+def load(path):
+    """Parse an export into a ChatIndex, through the disk cache when it is enabled"""
+    with open(path, 'rb') as file, chat_cache.mapped(file) as view:
+        digest = chat_cache.content_hash(view)
+        chat = chat_cache.load(digest)
+        if chat is None:
+            chat = chat_cache.load_extension(view, digest)
+        if chat is None:
+            view.seek(0)
+            df = preprocessor.preprocess_stream(view)
+            chat = helper.ChatIndex(df, digest=digest)
+        chat_cache.save(chat, view)
+    return chat
+
+
+def load_chats(path):
+    """{name: ChatIndex} for an export, or for every chat in a .zip or .gz"""
+    if not archives.is_archive(path):
+        return {os.path.basename(path): load(path)}
+    with open(path, 'rb') as file:
+        # One process per archive already; don't fork a second pool inside it
+        return archives.load_members(file, path, workers=1)
+
+
+def write_pdf(chat, path):
+    num_messages, words, num_media, num_links = helper.fetch_stats('Overall', chat)
+    pdf_bytes = pdf_generator.create_pdf(
+        'Overall', num_messages, words, num_media, num_links,
+        helper.most_busy_users(chat), helper.emoji_helper('Overall', chat),
+        helper.daily_timeline('Overall', chat)
+    )
+    with open(path, 'wb') as f:
+        f.write(pdf_bytes)
+
+
+def _stem(path):
+    name = os.path.basename(path)
+    if archives.is_archive(name):
+        name = os.path.splitext(name)[0]
+    return os.path.splitext(name)[0]
+
+
+def analyze(path, output, users='overall', pdf=True, parquet=False, name=None):
+    """Analyze one export into output/<name>/ (output/<name>/<chat>/ for each
+    chat of an archive holding several); returns (path, seconds, messages).
+    `name` defaults to the export's file name without its extensions."""
+    start = time.perf_counter()
+    chats = load_chats(path)
+    members = _output_names(list(chats))
+
+    for member, chat in chats.items():
+        out_dir = os.path.join(output, name or _stem(path))
+        if len(chats) > 1:
+            out_dir = os.path.join(out_dir, members[member])
+        os.makedirs(out_dir, exist_ok=True)
+
+        summary = chat_summary(chat, users)
+        chat_cache.save_tables(chat)
+        summary['file'] = os.path.abspath(path)
+        if archives.is_archive(path):
+            summary['member'] = member
+        with open(os.path.join(out_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        if pdf and len(chat.users):
+            write_pdf(chat, os.path.join(out_dir, 'report.pdf'))
+        if parquet:
+            chat.df.to_parquet(os.path.join(out_dir, 'messages.parquet'), index=False)
+
+    return path, time.perf_counter() - start, sum(len(chat) for chat in chats.values())
+
+
+def _output_names(paths):
+    # {path: name of its result directory}. Exports are usually all called
+    # "WhatsApp Chat with X.txt", so files of the same name get the name of
+    # their directory added, and a number if that isn't enough. Compared
+    # without case, for case-insensitive file systems.
+    stems = [_stem(path) for path in paths]
+    counts = {}
+    for stem in stems:
+        counts[stem.lower()] = counts.get(stem.lower(), 0) + 1
+
+    names = {}
+    used = set()
+    for path, stem in zip(paths, stems):
+        name = stem
+        parent = os.path.basename(os.path.dirname(path))
+        if counts[stem.lower()] > 1 and parent:
+            name = f"{stem} ({parent})"
+        unique, number = name, 1
+        while unique.lower() in used:
+            number += 1
+            unique = f"{name} {number}"
+        used.add(unique.lower())
+        names[path] = unique
+    return names
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze WhatsApp chat exports without the web app.")
+    parser.add_argument('inputs', nargs='+', help="export files, directories or glob patterns")
+    parser.add_argument('-o', '--output', default='whatsstat_results', help="directory for the results (default: %(default)s)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help="worker processes (default: %(default)s)")
+    parser.add_argument('-m', '--memory-limit', type=int, default=None, metavar='MB', help="address space limit per worker, in MB")
+    parser.add_argument('--users', choices=['overall', 'all'], default='overall', help="also summarize every user with 'all'")
+    parser.add_argument('--parquet', action='store_true', help="also write the parsed messages as Parquet")
+    parser.add_argument('--no-pdf', dest='pdf', action='store_false', help="skip the PDF report")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="directory of the parsed-chat cache (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    paths = find_exports(args.inputs)
+    if not paths:
+        print("No .txt, .zip or .gz exports found", file=sys.stderr)
+        return 2
+    names = _output_names([os.path.abspath(path) for path in paths])
+
+    os.makedirs(args.output, exist_ok=True)
+    cache_dir = os.path.abspath(args.cache_dir)
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=_init_worker,
+                             initargs=(args.memory_limit, cache_dir)) as pool:
+        futures = {pool.submit(analyze, path, args.output, args.users, args.pdf, args.parquet,
+                               names[os.path.abspath(path)]): path
+                   for path in paths}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                _, seconds, messages = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"[{done}/{len(paths)}] FAILED {path}: {type(e).__name__}: {e}", file=sys.stderr)
+            else:
+                print(f"[{done}/{len(paths)}] {path}: {messages} messages in {seconds:.1f}s", file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
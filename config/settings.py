@@ -35,7 +35,7 @@ CHART_CONFIG = {
 # File Upload Configuration
 UPLOAD_CONFIG = {
     'max_file_size': 200,  # MB
-    'allowed_extensions': ['txt'],
+    'allowed_extensions': ['txt', 'zip', 'gz'],
     'encoding': 'utf-8'
 }
 
@@ -44,5 +44,21 @@ ANALYSIS_CONFIG = {
     'max_common_words': 20,
     'max_emojis_display': 10,
     'max_trending_topics': 10,
+    'trend_window_months': 3,     # months a month's words are compared against
+    'max_wordcloud_words': 200,
+    'wordcloud_size': 500,        # px, square
+    'langdetect_workers': 4,      # processes for language detection, at most one per CPU
     'cols_per_row': 4
-}
\ No newline at end of file
+}
+# Cache Configuration
+CACHE_CONFIG = {
+    'max_chats': 4,        # parsed chats kept in memory, least recently used evicted first
+    'max_results': 256     # cached helper results (chat, user, function)
+}
+
+# Disk Cache Configuration
+DISK_CACHE_CONFIG = {
+    'enabled': True,
+    'directory': '.whatsstat_cache',
+    'max_size': 2048       # MB, least recently used chats are removed first
+}
@@ -1,10 +1,12 @@
 # helper/__init__.py
 
-from .stats import fetch_stats, most_busy_users, longest_message_sender, conversation_starter, conversation_starters
-from .wordcloud_utils import create_wordcloud, most_common_words
+from .chat_index import ChatIndex
+from .stats import fetch_stats, most_busy_users, longest_message_sender, conversation_starter
+from .sessions import conversation_starters, session_table, session_ids, session_stats, reply_times
+from .wordcloud_utils import create_wordcloud, wordcloud_png, most_common_words
 from .emoji_utils import emoji_helper
 from .timeline import monthly_timeline, daily_timeline
 from .activity import week_activity_map, month_activity_map, activity_heatmap, most_active_hour_heatmap
 from .sentiment import sentiment_analysis
 from .langdetect_utils import detect_languages
-from .trending import trending_topics_by_month
+from .trending import trending_topics_by_month, rising_topics_by_month, trend_months, top_topics, rising_topics
@@ -1,26 +1,25 @@
 # helper/activity.py
-def week_activity_map(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-    return df['day_name'].value_counts()
+from .chat_index import as_index
+from .cube import rollup
 
 
-def month_activity_map(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-    return df['month'].value_counts()
+def week_activity_map(selected_user, chat):
+    cube = as_index(chat).cube_frame(selected_user)
+    counts = rollup(cube, 'day_name').sort_values(ascending=False)
+    return counts[counts > 0]
 
 
-def activity_heatmap(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-    return df.pivot_table(index='day_name', columns='period', values='message', aggfunc='count').fillna(0)
+def month_activity_map(selected_user, chat):
+    cube = as_index(chat).cube_frame(selected_user)
+    counts = rollup(cube, 'month').sort_values(ascending=False)
+    return counts[counts > 0]
 
 
-def most_active_hour_heatmap(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+def activity_heatmap(selected_user, chat):
+    cube = as_index(chat).cube_frame(selected_user)
+    return rollup(cube, ['day_name', 'period']).unstack().fillna(0)
 
-    df['hour'] = df['date'].dt.hour
-    heatmap = df.groupby(['day_name', 'hour']).size().unstack().fillna(0)
-    return heatmap
+
+def most_active_hour_heatmap(selected_user, chat):
+    cube = as_index(chat).cube_frame(selected_user)
+    return rollup(cube, ['day_name', 'hour']).unstack().fillna(0)
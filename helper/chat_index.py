@@ -0,0 +1,240 @@
+# helper/chat_index.py
+from functools import cached_property
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from .cube import build_cube, merge_cubes
+
+
+class ChatIndex:
+    # Built once after preprocessing. Keeps the row positions of every user so
+    # selecting a user is a take of that user's rows instead of a comparison
+    # over the whole `user` column.
+
+    def __init__(self, df, digest=None, cube=None):
+        df = _with_message_columns(df)
+        self.df = df
+        # Content hash of the export this chat was parsed from, used as a cache key
+        self.digest = digest
+        self._cube = cube
+        # Session tables by gap threshold, see sessions()
+        self._sessions = {}
+        # Trend tables by (window, minimum count), see trends()
+        self._trends = {}
+        self._rows = df.groupby('user', observed=True).indices
+        self.users = sorted(user for user in self._rows if user != 'group_notification')
+
+    def __len__(self):
+        return len(self.df)
+
+    def frame(self, selected_user):
+        return self.select_rows(self.df, selected_user)
+
+    def select_rows(self, values, selected_user):
+        # The selected user's part of anything aligned row for row with the chat
+        if selected_user == 'Overall':
+            return values
+        rows = self._rows.get(selected_user)
+        if rows is None:
+            return values.iloc[:0]
+        return values.iloc[rows]
+
+    def extend(self, tail, digest=None):
+        # A chat made of this one followed by `tail`, the parsed messages of a
+        # newer export that were not in this one. Aggregates already built here
+        # are merged with the tail's instead of being rebuilt over the whole chat.
+        offset = len(self.df)
+        tail = tail.set_axis(pd.RangeIndex(offset, offset + len(tail)))
+        tail = _with_message_columns(tail)
+
+        users = union_categoricals([self.df['user'], tail['user']])
+        df = pd.concat([self.df.drop(columns='user'), tail.drop(columns='user')])
+        df.insert(1, 'user', users)
+        # The layout the newest messages were read with
+        df.attrs['date_format'] = tail.attrs.get('date_format', self.df.attrs.get('date_format'))
+        new = df.iloc[offset:]
+
+        cube = merge_cubes(self._cube, build_cube(new)) if self._cube is not None else None
+        chat = ChatIndex(df, digest=digest, cube=cube)
+
+        built = self.__dict__
+        # The tail's tokens and emojis are worked out once for all the tables
+        # that need them. A chat loaded from the disk cache has the count
+        # tables but not the tokens, which are then left to be built on use.
+        tail_tokens = tail_emojis = None
+        if built.keys() & {'tokens', 'token_counts', 'month_token_counts'}:
+            from .tokens import build_tokens
+            tail_tokens = build_tokens(new)
+        if built.keys() & {'emojis', 'emoji_counts'}:
+            from .emoji_utils import build_emojis
+            tail_emojis = build_emojis(new)
+
+        if 'tokens' in built:
+            chat.tokens = _append_rows(self.tokens, tail_tokens, users.categories)
+        if 'token_counts' in built:
+            chat.token_counts = _add_counts(self.token_counts, tail_tokens)
+        if 'month_token_counts' in built:
+            months = pd.DataFrame({'month': df['month_period'].loc[tail_tokens.index].to_numpy(),
+                                   'token': tail_tokens['token'].to_numpy()})
+            chat.month_token_counts = _add_counts(self.month_token_counts, months)
+        if 'emojis' in built:
+            chat.emojis = _append_rows(self.emojis, tail_emojis, users.categories)
+        if 'emoji_counts' in built:
+            chat.emoji_counts = _add_counts(self.emoji_counts, tail_emojis)
+        if 'polarity' in built:
+            from .sentiment import message_polarity
+            chat.polarity = pd.concat([self.polarity, message_polarity(new)])
+        return chat
+
+    @property
+    def cube(self):
+        if self._cube is None:
+            self._cube = build_cube(self.df)
+        return self._cube
+
+    @cached_property
+    def tokens(self):
+        from .tokens import build_tokens
+        return build_tokens(self.df)
+
+    @cached_property
+    def token_counts(self):
+        # (user, token) -> count, shared by the word cloud, common words and trends.
+        # Pairs in order of first use, so equal counts rank as Counter.most_common would
+        return self.tokens.groupby(['user', 'token'], observed=True, sort=False).size()
+
+    @cached_property
+    def month_token_counts(self):
+        # (month, token) -> count, pairs in order of first use
+        from .trending import build_month_token_counts
+        return build_month_token_counts(self.df, self.tokens)
+
+    @cached_property
+    def month_token_ranking(self):
+        # month_token_counts with months in order, each month's tokens most
+        # frequent first; a sort of the small count table, not of the messages
+        from .trending import rank_by_month
+        return rank_by_month(self.month_token_counts)
+
+    @cached_property
+    def month_bounds(self):
+        # month -> (start, stop) rows of month_token_ranking and of every trends() table
+        from .trending import month_bounds
+        return month_bounds(self.month_token_ranking)
+
+    def trends(self, window_months=3, min_count=3):
+        key = (window_months, min_count)
+        if key not in self._trends:
+            from .trending import build_trends
+            self._trends[key] = build_trends(self.month_token_counts, window_months, min_count)
+        return self._trends[key]
+
+    @cached_property
+    def emojis(self):
+        from .emoji_utils import build_emojis
+        return build_emojis(self.df)
+
+    @cached_property
+    def emoji_counts(self):
+        # Pairs in order of first use, like token_counts
+        return self.emojis.groupby(['user', 'emoji'], observed=True, sort=False).size()
+
+    @cached_property
+    def polarity(self):
+        from .sentiment import message_polarity
+        return message_polarity(self.df)
+
+    @cached_property
+    def timeline(self):
+        # Messages in time order with the gap before each, shared by all session thresholds
+        from .sessions import build_timeline
+        return build_timeline(self.df)
+
+    def sessions(self, threshold_minutes=30):
+        if threshold_minutes not in self._sessions:
+            from .sessions import build_sessions
+            self._sessions[threshold_minutes] = build_sessions(self.timeline, threshold_minutes)
+        return self._sessions[threshold_minutes]
+
+    @cached_property
+    def _cube_rows(self):
+        return self.cube.groupby('user', observed=True).indices
+
+    def cube_frame(self, selected_user):
+        # "Overall" is the whole cube; summing over it adds up all users
+        if selected_user == 'Overall':
+            return self.cube
+        rows = self._cube_rows.get(selected_user)
+        if rows is None:
+            return self.cube.iloc[:0]
+        return self.cube.iloc[rows]
+
+
+MESSAGE_COLUMNS = ('word_count', 'link_count', 'message_length', 'month_period')
+
+
+def _with_message_columns(df):
+    # Per-message fields every report needs, computed once when the chat is
+    # indexed (and kept when it is cached to disk). After this the helpers
+    # only read the frame. They are added to a shallow copy, so a frame passed
+    # in by a caller is left as it was.
+    from .stats import count_links, count_words
+    if all(column in df for column in MESSAGE_COLUMNS):
+        return df
+    df = df.copy(deep=False)
+    if 'word_count' not in df:
+        df['word_count'] = count_words(df['message'])
+    if 'link_count' not in df:
+        df['link_count'] = count_links(df['message'])
+    if 'message_length' not in df:
+        df['message_length'] = df['message'].str.len().astype('int32')
+    if 'month_period' not in df:
+        # Months since January 1970, the ordinal of the date's monthly pandas Period
+        df['month_period'] = ((df['year'].astype('int32') - 1970) * 12 + df['month_num'] - 1).astype('int32')
+    return df
+
+
+def _append_rows(table, more, categories):
+    table = table.assign(user=table['user'].cat.set_categories(categories))
+    more = more.assign(user=more['user'].cat.set_categories(categories))
+    return pd.concat([table, more])
+
+
+def _add_counts(counts, table):
+    # `table` has a user column and one value column, as tokens and emojis do.
+    # Keys new in `table` go after the existing ones, keeping first-use order.
+    more = table.groupby(list(table.columns), observed=True, sort=False).size()
+    keys = counts.index.append(more.index[~more.index.isin(counts.index)])
+    total = counts.reindex(keys, fill_value=0) + more.reindex(keys, fill_value=0)
+    return total.astype(counts.dtype)
+
+
+def as_index(chat):
+    # Helpers take a ChatIndex or, as they used to, a preprocessed frame. A
+    # frame is indexed on first use and the index kept on the frame, so later
+    # calls don't work out the message columns again; it is indexed again if
+    # rows or columns were added since.
+    if isinstance(chat, ChatIndex):
+        return chat
+    key = (len(chat), tuple(chat.columns))
+    cached = chat.__dict__.get('_chat_index')
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    index = ChatIndex(chat)
+    # Not a column; pandas' own __setattr__ would warn about that
+    object.__setattr__(chat, '_chat_index', (key, index))
+    return index
+
+
+def select_counts(counts, selected_user, level):
+    # `counts` is indexed by (user, level); "Overall" adds up all users
+    if selected_user == 'Overall':
+        return counts.groupby(level=level, sort=False).sum()
+    if selected_user in counts.index.get_level_values('user'):
+        return counts.xs(selected_user, level='user')
+    return counts.iloc[:0].droplevel('user')
+
+
+def user_frame(selected_user, chat):
+    return as_index(chat).frame(selected_user)
@@ -0,0 +1,32 @@
+# helper/cube.py
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+def build_cube(df):
+    # Message counts per (user, date, hour). Every activity chart is a roll-up of
+    # this table, which is tiny compared to the chat itself.
+    cube = df.groupby(['user', 'only_date', 'hour'], observed=True).size().rename('count').reset_index()
+
+    date = cube['only_date'].dt
+    cube['year'] = date.year.astype('int16')
+    cube['month_num'] = date.month.astype('int8')
+    cube['month'] = pd.Categorical.from_codes(date.month.to_numpy() - 1, dtype=df['month'].dtype)
+    cube['day_name'] = pd.Categorical.from_codes(date.dayofweek.to_numpy(), dtype=df['day_name'].dtype)
+    cube['period'] = pd.Categorical.from_codes(cube['hour'].to_numpy(), dtype=df['period'].dtype)
+    return cube
+
+
+def merge_cubes(cube, other):
+    # Adds up two cubes, e.g. a cached chat's and the one of its newly appended messages
+    users = union_categoricals([cube['user'], other['user']])
+    merged = pd.concat([cube.drop(columns='user'), other.drop(columns='user')], ignore_index=True)
+    merged.insert(0, 'user', users)
+
+    keys = [column for column in merged.columns if column != 'count']
+    merged = merged.groupby(keys, observed=True)['count'].sum().reset_index()
+    return merged[cube.columns]
+
+
+def rollup(cube, by):
+    return cube.groupby(by, observed=True)['count'].sum()
@@ -1,14 +1,75 @@
 # helper/emoji_utils.py
-import emoji
-from collections import Counter
+import re
+from functools import lru_cache
+
 import pandas as pd
+from .chat_index import as_index, select_counts
+
+NON_ASCII = r'[^\x00-\x7f]'
+
+
+# Characters that may follow an emoji inside one sequence: variation
+# selectors, the keycap mark, skin tones and tag characters
+MODIFIERS = '\ufe0e\ufe0f\u20e3\U0001F3FB-\U0001F3FF\U000E0020-\U000E007F'
+
+
+def _char_ranges(code_points):
+    # Collapse sorted code points into "a-b" ranges; a class of ranges is far
+    # cheaper for the regex engine to test than a list of single characters
+    ranges = []
+    for code_point in code_points:
+        if ranges and ranges[-1][1] == code_point - 1:
+            ranges[-1][1] = code_point
+        else:
+            ranges.append([code_point, code_point])
+    return ''.join(re.escape(chr(low)) if low == high else f'{re.escape(chr(low))}-{re.escape(chr(high))}'
+                   for low, high in ranges)
+
+
+@lru_cache(maxsize=None)
+def emoji_pattern():
+    # Matches whole emoji-shaped sequences: keycaps, flag pairs, and an emoji
+    # followed by modifiers, optionally joined to more emoji with ZWJ. Built
+    # from character classes only, so scanning a message is a single pass.
+    import emoji
+
+    starts = sorted({ord(sequence[0]) for sequence in emoji.EMOJI_DATA if not sequence[0].isascii()})
+    start = '[' + _char_ranges(starts) + ']'
+    modifiers = '[' + MODIFIERS + ']*'
+    return re.compile(
+        '[#*0-9]\ufe0f?\u20e3'
+        '|[\U0001F1E6-\U0001F1FF]{2}'
+        f'|{start}{modifiers}(?:\u200d{start}{modifiers})*'
+    )
+
+
+def _split_unknown(sequence):
+    # Sequences the database doesn't know as a whole, e.g. a ZWJ combination
+    # that isn't a standard emoji, are split into the emoji they contain
+    import emoji
+
+    return [match['emoji'] for match in emoji.emoji_list(sequence)]
+
+
+def build_emojis(df):
+    # One row per emoji occurrence, indexed by the message's row label. Only
+    # messages with a non-ASCII character can contain one.
+    import emoji
+
+    messages = df['message']
+    candidates = messages[messages.str.contains(NON_ASCII)]
+    found = candidates.str.findall(emoji_pattern()).explode().dropna()
+
+    unknown = ~found.isin(emoji.EMOJI_DATA.keys())
+    if unknown.any():
+        found = pd.concat([found[~unknown], found[unknown].map(_split_unknown).explode().dropna()])
+        # Back into message order, so counts keep the order emojis were first used in
+        found = found.sort_index(kind='stable')
+    return pd.DataFrame({'user': df['user'].loc[found.index], 'emoji': found.astype(str)})
 
-def emoji_helper(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
 
-    emojis = []
-    for msg in df['message']:
-        emojis.extend([c for c in msg if emoji.is_emoji(c)])
+def emoji_helper(selected_user, chat):
+    counts = select_counts(as_index(chat).emoji_counts, selected_user, 'emoji')
+    counts = counts.sort_values(ascending=False, kind='stable')
 
-    return pd.DataFrame(Counter(emojis).most_common(len(Counter(emojis))), columns=['emoji', 'count'])
+    return pd.DataFrame({'emoji': counts.index, 'count': counts.values})
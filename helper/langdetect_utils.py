@@ -1,36 +1,143 @@
 # helper/langdetect_utils.py
-from langdetect import detect, DetectorFactory
+import hashlib
+import multiprocessing
+import os
+import sqlite3
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
 import pandas as pd
+from config.settings import ANALYSIS_CONFIG, DISK_CACHE_CONFIG
 from language_utils import get_language_name
+from .chat_index import user_frame
+
+SAMPLE_SIZE = 1000
+# Messages per task sent to a worker process
+BATCH_SIZE = 500
+# Below this many undetected messages a process pool costs more than it saves
+POOL_THRESHOLD = 2000
+# Detected languages kept across reruns, users and chats
+CACHE_SIZE = 1_000_000
+# Detected languages also go to this file in the disk cache directory, so they
+# survive restarts and are shared by every process
+LANG_DB = 'languages.sqlite'
+
+# blake2b digest of a message -> language code (or None if undetectable), for
+# the messages this process has detected or looked up
+_lang_cache = {}
+
+
+def _key(msg):
+    return hashlib.blake2b(msg.encode('utf-8'), digest_size=16).digest()
+
+
+def _detect(msg):
+    from langdetect import detect
+    from langdetect.lang_detect_exception import LangDetectException
+    try:
+        return detect(msg)
+    except LangDetectException:  # no letters to go on, e.g. only digits or URLs
+        return None
+
+
+def _detect_batch(messages):
+    # langdetect reads its language profiles on first use; importing it here
+    # keeps them out of startup and out of processes that never detect
+    from langdetect import DetectorFactory
+    DetectorFactory.seed = 0
+    return [_detect(msg) for msg in messages]
+
+
+def _detect_all(messages, workers=None):
+    workers = workers or min(ANALYSIS_CONFIG['langdetect_workers'], os.cpu_count() or 1)
+    if workers < 2 or len(messages) < POOL_THRESHOLD:
+        return _detect_batch(messages)
+
+    batches = [messages[i:i + BATCH_SIZE] for i in range(0, len(messages), BATCH_SIZE)]
+    # Spawned, not forked: this runs inside Streamlit's threaded server, and a
+    # child forked while other threads hold locks can hang
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        return [lang for batch in pool.map(_detect_batch, batches) for lang in batch]
 
-DetectorFactory.seed = 0
 
-def detect_languages(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+@contextmanager
+def _stored_languages():
+    os.makedirs(DISK_CACHE_CONFIG['directory'], exist_ok=True)
+    conn = sqlite3.connect(os.path.join(DISK_CACHE_CONFIG['directory'], LANG_DB), timeout=10)
+    try:
+        conn.execute('CREATE TABLE IF NOT EXISTS languages (key BLOB PRIMARY KEY, lang TEXT)')
+        with conn:  # commits
+            yield conn
+    finally:
+        conn.close()
+
+
+def _load_stored(keys):
+    # Languages detected by earlier runs or other processes, for keys not in memory
+    if not DISK_CACHE_CONFIG['enabled'] or not keys:
+        return {}
+    found = {}
+    try:
+        with _stored_languages() as conn:
+            for i in range(0, len(keys), BATCH_SIZE):
+                batch = keys[i:i + BATCH_SIZE]
+                placeholders = ','.join('?' * len(batch))
+                found.update(conn.execute(f'SELECT key, lang FROM languages WHERE key IN ({placeholders})', batch))
+    except sqlite3.Error:  # unreadable or locked for too long; detect again
+        pass
+    return found
+
+
+def _store(keys, languages):
+    if not DISK_CACHE_CONFIG['enabled']:
+        return
+    try:
+        with _stored_languages() as conn:
+            conn.executemany('INSERT OR REPLACE INTO languages VALUES (?, ?)', zip(keys, languages))
+            # Oldest rows go first once the table is full
+            conn.execute('DELETE FROM languages WHERE rowid <= (SELECT max(rowid) FROM languages) - ?', (CACHE_SIZE,))
+    except sqlite3.Error:
+        pass
+
+
+def _remember(keys, languages):
+    _lang_cache.update(zip(keys, languages))
+    # Oldest entries go first once the cache is full
+    overflow = len(_lang_cache) - CACHE_SIZE
+    for key in list(_lang_cache)[:max(overflow, 0)]:
+        del _lang_cache[key]
+
+
+def detect_languages(selected_user, chat, full=False, workers=None):
+    # By default detects a random sample of SAMPLE_SIZE messages; full=True
+    # detects every message. Detections are cached by message hash, in memory
+    # and on disk, so reruns, other users and restarts only detect messages
+    # not seen before.
+    df = user_frame(selected_user, chat)
 
     temp = df[(df['user'] != 'group_notification') & (df['message'] != '<Media omitted>')]
-    temp = temp[temp['message'].str.len() > 20]  # skip very short messages
-
-    # Sample messages if large dataset
-    sample_size = 1000
-    if len(temp) > sample_size:
-        temp = temp.sample(n=sample_size, random_state=42)
-
-    lang_cache = {}
-    languages = []
-    for msg in temp['message']:
-        if msg in lang_cache:
-            lang = lang_cache[msg]
-        else:
-            try:
-                lang = detect(msg)
-            except:
-                lang = None
-            lang_cache[msg] = lang
-        if lang:
-            languages.append(lang)
+    temp = temp[temp['message_length'] > 20]  # skip very short messages
+
+    if not full and len(temp) > SAMPLE_SIZE:
+        temp = temp.sample(n=SAMPLE_SIZE, random_state=42)
+
+    keys = [_key(msg) for msg in temp['message']]
+    todo = {}
+    for key, msg in zip(keys, temp['message']):
+        if key not in _lang_cache and key not in todo:
+            todo[key] = msg
+    if todo:
+        stored = _load_stored(list(todo))
+        _remember(stored.keys(), stored.values())
+        todo = {key: msg for key, msg in todo.items() if key not in stored}
+    if todo:
+        languages = _detect_all(list(todo.values()), workers)
+        _remember(todo.keys(), languages)
+        _store(todo.keys(), languages)
+
+    languages = [lang for lang in (_lang_cache.get(key) for key in keys) if lang]
 
     lang_counts = Counter(languages)
     lang_df = pd.DataFrame(lang_counts.most_common(3), columns=['Language', 'Count'])
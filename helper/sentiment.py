@@ -1,23 +1,175 @@
 # helper/sentiment.py
-from textblob import TextBlob
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
-def sentiment_analysis(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+import numpy as np
+import pandas as pd
+from .chat_index import as_index, user_frame
+
+# Split off like pattern's tokenizer does before it looks at the words
+CONTRACTIONS = ("'d", "'m", "'s", "'ll", "'re", "'ve", "n't")
+QUOTES = ('\u201c', '\u201d', '\u2018', '\u2019', "'", '"')
+# Split off the start (and, with ".", the end) of a word
+PUNCTUATION = ",;:!?()[]{}`'\"@#$^&*+-|=~_"
+NEGATIONS = ('no', 'not', "n't", 'never')
+
+
+@lru_cache(maxsize=None)
+def _lexicon():
+    # From the lexicon TextBlob's default analyzer uses: word -> (polarity,
+    # intensity), the words that modify the next one (adverbs) and
+    # emoticon -> polarity
+    from textblob import _text
+    from textblob.en import sentiment
+    words = {word: (values[None][0], values[None][2]) for word, values in sentiment.items() if None in values}
+    modifiers = frozenset(word for word, values in sentiment.items() if 'RB' in values)
+    emoticons = {}
+    for (_, polarity), faces in _text.EMOTICONS.items():
+        for face in faces:
+            emoticons.setdefault(face.lower(), polarity)
+    return words, modifiers, emoticons
+
+
+@lru_cache(maxsize=None)
+def _token_pattern():
+    # One pass standing in for pattern's tokenizer: emoticons (kept whole when
+    # only punctuation follows them), the sarcasm mark "(!)", words with any
+    # leading punctuation but "." and any trailing punctuation split off, "..."
+    # and single punctuation marks
+    from textblob import _text
+    faces = sorted({face for faces in _text.EMOTICONS.values() for face in faces}, key=len, reverse=True)
+    leading = re.escape(PUNCTUATION)
+    trailing = re.escape(PUNCTUATION + '.')
+    return re.compile(
+        rf"(?:{'|'.join(map(re.escape, faces))})(?=[{trailing}]*(?:\s|$))"
+        rf"|\(\s*!\s*\)"
+        rf"|[^\s{leading}]\S*[^\s{trailing}]|[^\s{trailing}]"
+        rf"|\.\.\.|[{trailing}]"
+    )
+
+
+def _tokens(text):
+    for contraction in CONTRACTIONS:
+        text = text.replace(contraction, ' ' + contraction)
+    for quote in QUOTES:
+        text = text.replace(quote, f' {quote} ')
+    return [token.lower() for token in _token_pattern().findall(text)]
+
+
+def _polarity(words, lexicon, modifiers, emoticons):
+    # pattern's Sentiment.assessments over words without part-of-speech tags:
+    # an adverb ("very") multiplies the polarity of the known word after it
+    # by its intensity and the two count as one assessment; a negation before
+    # a known word multiplies the assessment by -0.5 and is kept across
+    # words of one letter ("not a good"); "!" multiplies the assessment before
+    # it by 1.25; emoticons count as words. The score is the average over the
+    # assessments.
+    assessments = []  # [polarity, intensity, negated]
+    modifier = negation = None
+    for word in words:
+        known = lexicon.get(word)
+        if known is not None:
+            polarity, intensity = known
+            if modifier is None:
+                assessments.append([polarity, intensity, False])
+            else:
+                last = assessments[-1]
+                last[0] = max(-1.0, min(polarity * last[1], 1.0))
+                last[1] = intensity
+            if negation is not None:
+                assessments[-1][1] = 1.0 / assessments[-1][1]
+                assessments[-1][2] = True
+            modifier = word if word in modifiers else None
+            negation = word if word in NEGATIONS else None
+            continue
+
+        if word in NEGATIONS:
+            negation = word
+        elif negation and len(word.strip("'")) > 1:
+            negation = None
+        if negation is not None and modifier is not None and modifier.endswith('ly'):
+            # "really not good"
+            assessments[-1][2] = True
+            negation = None
+        elif modifier and len(word) > 2:
+            modifier = None
+        if word == '!' and assessments:
+            assessments[-1][0] = max(-1.0, min(assessments[-1][0] * 1.25, 1.0))
+        if word == '(!)':
+            assessments.append([0.0, 1.0, False])
+        if not word.isalpha() and len(word) <= 5 and word not in PUNCTUATION:
+            face = emoticons.get(word)
+            if face is not None:
+                assessments.append([face, 1.0, False])
+
+    if not assessments:
+        return 0.0
+    return sum(-0.5 * polarity if negated else polarity for polarity, _, negated in assessments) / len(assessments)
+
+
+def _lexicon_polarity(texts):
+    # TextBlob's default polarity, worked out without TextBlob: the words are
+    # looked up in its lexicon and scored by pattern's rules (_polarity). The
+    # tokenizer is a single regex instead of pattern's, so unusual punctuation
+    # (abbreviations, emoticons run into words) can split differently.
+    lexicon, modifiers, emoticons = _lexicon()
+    return np.fromiter((_polarity(_tokens(text), lexicon, modifiers, emoticons) for text in texts),
+                       dtype=float, count=len(texts))
+
+
+def message_polarity(df):
+    # Lexicon polarity of every message, NaN for media and notifications. Each
+    # distinct text is scored once.
+    text = df['message'].where((df['message'] != '<Media omitted>') & (df['user'] != 'group_notification'))
+    codes, uniques = pd.factorize(text)
+    scores = _lexicon_polarity(list(uniques))
+
+    polarity = np.full(len(df), np.nan, dtype='float32')
+    polarity[codes >= 0] = scores[codes[codes >= 0]]
+    return pd.Series(polarity, index=df.index)
+
+
+def _textblob_polarity(text):
+    from textblob import TextBlob
+    return TextBlob(text).sentiment.polarity
+
+
+def _textblob_polarities(texts, workers=None):
+    if workers and workers > 1 and len(texts) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(texts) // (workers * 4))
+            return np.fromiter(pool.map(_textblob_polarity, texts, chunksize=chunksize), dtype=float, count=len(texts))
+    return np.fromiter((_textblob_polarity(text) for text in texts), dtype=float, count=len(texts))
+
+
+def sentiment_analysis(selected_user, chat, method='lexicon', workers=None):
+    # method='lexicon' reads the per-message lexicon scores kept on the chat;
+    # method='textblob' runs TextBlob itself, optionally spread over `workers`
+    # processes.
+    if method != 'textblob':
+        chat = as_index(chat)
+        polarity = chat.select_rows(chat.polarity, selected_user)
+        return {
+            'positive': int((polarity > 0).sum()),
+            'negative': int((polarity < 0).sum()),
+            'neutral': int((polarity == 0).sum()),
+        }
+
+    df = user_frame(selected_user, chat)
 
     df = df[df['message'] != '<Media omitted>']
     df = df[df['user'] != 'group_notification']
 
-    sentiments = {'positive': 0, 'negative': 0, 'neutral': 0}
+    # Score every distinct text once; "ok" and "haha" only need one lookup
+    counts = df['message'].value_counts()
+    texts = counts.index.tolist()
 
-    for msg in df['message']:
-        analysis = TextBlob(msg)
-        polarity = analysis.sentiment.polarity
-        if polarity > 0:
-            sentiments['positive'] += 1
-        elif polarity < 0:
-            sentiments['negative'] += 1
-        else:
-            sentiments['neutral'] += 1
+    polarity = _textblob_polarities(texts, workers)
 
-    return sentiments
+    counts = counts.to_numpy()
+    return {
+        'positive': int(counts[polarity > 0].sum()),
+        'negative': int(counts[polarity < 0].sum()),
+        'neutral': int(counts[polarity == 0].sum()),
+    }
@@ -0,0 +1,124 @@
+# helper/sessions.py
+# Conversations ("sessions") are runs of messages with no silence longer than a
+# threshold between them. The messages are sorted by time once per chat
+# (ChatIndex.timeline); splitting them for a threshold is a comparison and a
+# cumulative sum over the gaps, so changing the threshold never re-sorts.
+import numpy as np
+import pandas as pd
+from .chat_index import as_index
+
+
+def build_timeline(df):
+    # Messages by people (no group notifications) in time order: the row label
+    # of each in the chat, its date, its sender and the seconds since the
+    # message before it. The first message's gap is infinite, so it always
+    # starts a session.
+    people = df[df['user'] != 'group_notification']
+    order = np.argsort(people['date'].to_numpy(), kind='stable')
+    people = people.iloc[order]
+
+    times = people['date'].to_numpy()
+    gaps = np.empty(len(times))
+    gaps[:1] = np.inf
+    gaps[1:] = np.diff(times) / np.timedelta64(1, 's')
+    return pd.DataFrame({
+        'row': people.index.to_numpy(),
+        'date': people['date'].to_numpy(),
+        'user': people['user'].values,
+        'gap': gaps,
+    })
+
+
+def _session_numbers(timeline, threshold_minutes):
+    new = timeline['gap'].to_numpy() > threshold_minutes * 60
+    return new, np.cumsum(new) - 1
+
+
+def _replies(timeline, new):
+    # A reply is a message inside a session from someone other than whoever
+    # wrote the message before it
+    codes = timeline['user'].cat.codes.to_numpy()
+    reply = ~new
+    reply[1:] &= codes[1:] != codes[:-1]
+    return reply
+
+
+def build_sessions(timeline, threshold_minutes):
+    # One row per session: when it started and ended, how many messages it
+    # has, who started it, how many people took part, how many replies there
+    # were and how long the first and an average reply took, in seconds.
+    new, session = _session_numbers(timeline, threshold_minutes)
+    starts = np.flatnonzero(new)
+    count = len(starts)
+    ends = np.append(starts[1:], len(new))[:count] - 1
+
+    users = timeline['user']
+    codes = users.cat.codes.to_numpy().astype('int64')
+    width = max(len(users.cat.categories), 1)
+    # Distinct (session, sender) pairs, found by hashing rather than sorting
+    pairs = pd.unique(session * width + codes)
+    participants = np.bincount(pairs // width, minlength=count)
+
+    reply = _replies(timeline, new)
+    reply_session = session[reply]
+    reply_gap = timeline['gap'].to_numpy()[reply]
+    replies = np.bincount(reply_session, minlength=count)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_reply = np.bincount(reply_session, weights=reply_gap, minlength=count) / replies
+    # Session numbers only go up, so a session's first reply is where the number changes
+    first = np.flatnonzero(np.diff(reply_session, prepend=-1))
+    first_reply = np.full(count, np.nan)
+    first_reply[reply_session[first]] = reply_gap[first]
+
+    dates = timeline['date'].to_numpy()
+    return pd.DataFrame({
+        'start': dates[starts],
+        'end': dates[ends],
+        'size': ends - starts + 1,
+        'starter': pd.Categorical.from_codes(codes[starts], dtype=users.dtype),
+        'participants': participants,
+        'replies': replies,
+        'first_reply_seconds': first_reply,
+        'mean_reply_seconds': mean_reply,
+    })
+
+
+def session_table(chat, threshold_minutes=30):
+    return as_index(chat).sessions(threshold_minutes)
+
+
+def session_ids(chat, threshold_minutes=30):
+    # Session number of every message in the chat, -1 for group notifications
+    chat = as_index(chat)
+    _, session = _session_numbers(chat.timeline, threshold_minutes)
+    ids = pd.Series(session, index=chat.timeline['row'])
+    return ids.reindex(chat.df.index, fill_value=-1)
+
+
+def conversation_starters(chat, threshold_minutes=30):
+    counts = session_table(chat, threshold_minutes)['starter'].value_counts()
+    return counts[counts > 0]
+
+
+def session_stats(chat, threshold_minutes=30):
+    # median_first_reply_minutes is None when no conversation got a reply
+    sessions = session_table(chat, threshold_minutes)
+    duration = (sessions['end'] - sessions['start']).dt.total_seconds()
+    first_reply = sessions['first_reply_seconds'].dropna()
+    return {
+        'sessions': len(sessions),
+        'median_messages': float(sessions['size'].median()) if len(sessions) else 0.0,
+        'median_minutes': float(duration.median() / 60) if len(sessions) else 0.0,
+        'median_first_reply_minutes': float(first_reply.median() / 60) if len(first_reply) else None,
+    }
+
+
+def reply_times(chat, threshold_minutes=30):
+    # Median seconds each person takes to answer someone else within a session,
+    # fastest first
+    chat = as_index(chat)
+    timeline = chat.timeline
+    new, _ = _session_numbers(timeline, threshold_minutes)
+    reply = _replies(timeline, new)
+    latency = timeline.loc[reply, 'gap'].groupby(timeline.loc[reply, 'user'], observed=True).median()
+    return latency.sort_values()
@@ -1,57 +1,66 @@
 # helper/stats.py
-from urlextract import URLExtract
+from functools import lru_cache
+
 import pandas as pd
+from .chat_index import as_index
+from .cube import rollup
 
-extractor = URLExtract()
+# Cheap test for "could contain a URL": a scheme, www. or a dot followed by letters
+URL_HINT = r'(?i)https?://|www\.|\.[a-z]{2,}'
 
-def fetch_stats(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
 
-    num_messages = df.shape[0]
+@lru_cache(maxsize=None)
+def _extractor():
+    # URLExtract loads its TLD list when constructed; wait until a link needs checking
+    from urlextract import URLExtract
+    return URLExtract()
+
+
+def count_words(messages):
+    return messages.str.count(r'\S+').astype('int32')
+
 
-    words = []
-    for msg in df['message']:
-        words.extend(msg.split())
+def count_links(messages):
+    # URLExtract is slow, so only run it on messages that pass the cheap test
+    candidates = messages[messages.str.contains(URL_HINT)]
+    counts = pd.Series([len(_extractor().find_urls(msg)) for msg in candidates], index=candidates.index, dtype='int32')
+    return counts.reindex(messages.index, fill_value=0)
 
-    num_media_messages = df[df['message'] == '<Media omitted>'].shape[0]
 
-    links = []
-    for msg in df['message']:
-        links.extend(extractor.find_urls(msg))
+def fetch_stats(selected_user, chat):
+    df = as_index(chat).frame(selected_user)
 
-    return num_messages, len(words), num_media_messages, len(links)
+    num_messages = df.shape[0]
+    words = int(df['word_count'].sum())
+    num_media_messages = int((df['message'] == '<Media omitted>').sum())
+    links = int(df['link_count'].sum())
+
+    return num_messages, words, num_media_messages, links
 
 
-def most_busy_users(df):
-    x = df['user'].value_counts().head()
-    df_percent = round((df['user'].value_counts() / df.shape[0]) * 100, 2).reset_index()
+def most_busy_users(chat):
+    counts = rollup(as_index(chat).cube, 'user').sort_values(ascending=False)
+    counts = counts[counts > 0]
+    x = counts.head()
+    df_percent = round((counts / counts.sum()) * 100, 2).reset_index()
     df_percent.columns = ['user', 'percent']
     return x, df_percent
 
 
 
-def longest_message_sender(df):
-    df['message_length'] = df['message'].apply(len)
-    df_filtered = df[df['user'] != 'group_notification']
-    longest_msg = df_filtered.loc[df_filtered['message_length'].idxmax()]
+def longest_message_sender(chat):
+    df = as_index(chat).df
+    lengths = df['message_length'].where(df['user'] != 'group_notification')
+    longest_msg = df.loc[lengths.idxmax()]
     return longest_msg['user'], longest_msg['message'], longest_msg['message_length']
 
 
-def conversation_starter(df):
-    df = df[df['user'] != 'group_notification']
-    df['hour'] = df['date'].dt.hour
-    early_df = df[df['hour'] < 7]  
-    starter = early_df['user'].value_counts().idxmax()
-    starter_count = early_df['user'].value_counts().max()
+def conversation_starter(chat):
+    # Who writes the most messages before 7 am
+    cube = as_index(chat).cube
+    early = cube[(cube['hour'] < 7) & (cube['user'] != 'group_notification')]
+    counts = rollup(early, 'user')
+    counts = counts[counts > 0]
+    starter = counts.idxmax()
+    starter_count = counts.max()
     return starter, starter_count
-
-
-def conversation_starters(df, threshold_minutes=30):
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.sort_values('date').reset_index(drop=True)
-    df['gap'] = df['date'].diff().fillna(pd.Timedelta(seconds=0))
-    df['new_convo'] = df['gap'] > pd.Timedelta(minutes=threshold_minutes)
-
-    starters = df[df['new_convo']]['user']
-    return starters.value_counts()
@@ -1,18 +1,20 @@
 # helper/timeline.py
-def monthly_timeline(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+from .chat_index import as_index
+from .cube import rollup
 
-    timeline = df.groupby(['year', 'month_num', 'month']).count()['message'].reset_index()
+
+def monthly_timeline(selected_user, chat):
+    cube = as_index(chat).cube_frame(selected_user)
+
+    timeline = rollup(cube, ['year', 'month_num', 'month']).rename('message').reset_index()
 
     time = [f"{timeline['month'][i]} - {timeline['year'][i]}" for i in range(timeline.shape[0])]
     timeline['time'] = time
     return timeline
 
 
-def daily_timeline(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+def daily_timeline(selected_user, chat):
+    cube = as_index(chat).cube_frame(selected_user)
 
-    daily_timeline = df.groupby('only_date').count()['message'].reset_index()
+    daily_timeline = rollup(cube, 'only_date').rename('message').reset_index()
     return daily_timeline
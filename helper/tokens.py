@@ -0,0 +1,28 @@
+# helper/tokens.py
+import os
+from functools import lru_cache
+
+import pandas as pd
+from .chat_index import as_index, select_counts
+
+STOP_WORDS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stop_hinglish.txt')
+
+
+@lru_cache(maxsize=None)
+def stop_words():
+    with open(STOP_WORDS_PATH, 'r') as f:
+        return frozenset(line.strip() for line in f if line.strip())
+
+
+def build_tokens(df):
+    # One row per kept word of every text message, indexed by the message's row
+    # label. Lower-cased, whitespace-split and stop words removed, in one pass.
+    text = df[(df['user'] != 'group_notification') & (df['message'] != '<Media omitted>')]
+    words = text['message'].str.lower().str.split().explode()
+    words = words[words.notna() & ~words.isin(stop_words())]
+    return pd.DataFrame({'user': text['user'].loc[words.index], 'token': words.astype(str)})
+
+
+def token_counts(selected_user, chat):
+    counts = select_counts(as_index(chat).token_counts, selected_user, 'token')
+    return counts.sort_values(ascending=False, kind='stable')
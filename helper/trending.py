@@ -1,23 +1,139 @@
 # helper/trending.py
-from collections import Counter
+# Topics per month. Token counts per (month, token) are built once per chat
+# (ChatIndex.month_token_counts) and ranked with each month's tokens most
+# frequent first (ChatIndex.month_token_ranking), so the top k of a month is a
+# slice of k rows. "Rising" topics score every
+# (month, token) at once against the same token's share of the words in the
+# months before it, using cumulative sums instead of a loop over months.
+import numpy as np
+import pandas as pd
+from .chat_index import as_index
 
-def trending_topics_by_month(df):
-    with open('stop_hinglish.txt', 'r') as f:
-        stop_words = f.read()
 
-    df['month_year'] = df['date'].dt.to_period('M')
-    df = df[df['message'] != '<Media omitted>']
-    df = df[df['user'] != 'group_notification']
+def _label(period):
+    # Months since January 1970 -> "YYYY-MM"
+    return f"{1970 + period // 12}-{period % 12 + 1:02d}"
 
-    result = {}
 
-    for period, group in df.groupby('month_year'):
-        words = []
-        for msg in group['message']:
-            for word in msg.lower().split():
-                if word not in stop_words:
-                    words.append(word)
-        common = Counter(words).most_common(10)
-        result[str(period)] = dict(common)
+def _period(label):
+    year, month = label.split('-')
+    return (int(year) - 1970) * 12 + int(month) - 1
+
+
+def rank_by_month(counts):
+    # Months in order, each month's tokens by count, ties in the order given
+    # (first use, as Counter.most_common would)
+    months = counts.index.get_level_values('month').to_numpy()
+    return counts.iloc[np.lexsort((-counts.to_numpy(), months))]
+
+
+def build_month_token_counts(df, tokens):
+    months = df['month_period'].loc[tokens.index]
+    table = pd.DataFrame({'month': months.to_numpy(), 'token': tokens['token'].to_numpy()})
+    return table.groupby(['month', 'token'], sort=False).size()
+
+
+def month_bounds(counts):
+    # month -> (start, stop) positions of its rows, in any table ordered by month
+    months = counts.index.get_level_values('month').to_numpy()
+    if not len(months):
+        return {}
+    starts = np.flatnonzero(np.diff(months, prepend=months[0] - 1))
+    stops = np.append(starts[1:], len(months))
+    return {int(months[start]): (start, stop) for start, stop in zip(starts, stops)}
+
+
+def build_trends(counts, window_months=3, min_count=3):
+    # One row per (month, token): its count, its share of the month's words,
+    # its share of the words of the `window_months` months before, and a score,
+    # the log2 ratio of the two shares smoothed by one word. The score is NaN
+    # for a month without earlier words and for tokens used fewer than
+    # `min_count` times. Rows are ordered by month, highest score first, ties
+    # in the order of `counts`.
+    months = counts.index.get_level_values('month').to_numpy().astype('int64')
+    codes, _ = pd.factorize(counts.index.get_level_values('token'))
+    values = counts.to_numpy().astype('float64')
+    if not len(values):
+        return pd.DataFrame({'month': months, 'token': counts.index.get_level_values('token'), 'count': values,
+                             'share': values, 'baseline_share': values, 'score': values})
+
+    # Slot 0 stands for "before the first month", so windows can start there
+    slot = months - months.min() + 1
+    span = int(slot.max()) + 1
+    start = np.maximum(slot - window_months - 1, 0)
+
+    # Words per month, and in each row's window
+    cum_totals = np.cumsum(np.bincount(slot, weights=values, minlength=span))
+    totals = cum_totals[slot] - cum_totals[slot - 1]
+    baseline_totals = cum_totals[slot - 1] - cum_totals[start]
+
+    # The token's own count in its window, from a running sum over (token, month) keys
+    keys = codes.astype('int64') * span + slot
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    running = np.concatenate([[0.0], np.cumsum(values[order])])
+    base = codes.astype('int64') * span
+    baseline_counts = (running[np.searchsorted(sorted_keys, base + slot - 1, side='right')]
+                       - running[np.searchsorted(sorted_keys, base + start, side='right')])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        share = values / totals
+        baseline_share = baseline_counts / baseline_totals
+        score = np.log2((values + 1) / (totals + 1)) - np.log2((baseline_counts + 1) / (baseline_totals + 1))
+    score[(baseline_totals == 0) | (values < min_count)] = np.nan
 
+    order = np.lexsort((np.where(np.isnan(score), np.inf, -score), months))
+    return pd.DataFrame({
+        'month': months[order],
+        'token': counts.index.get_level_values('token')[order],
+        'count': counts.to_numpy()[order],
+        'share': share[order],
+        'baseline_share': baseline_share[order],
+        'score': score[order],
+    })
+
+
+def _month_rows(chat, month):
+    return chat.month_bounds.get(_period(month), (0, 0))
+
+
+def trend_months(chat):
+    """Months with any words, oldest first, as "YYYY-MM" """
+    return [_label(period) for period in as_index(chat).month_bounds]
+
+
+def top_topics(month, chat, k=10):
+    """The k most used tokens of a month ("YYYY-MM") with their counts"""
+    chat = as_index(chat)
+    start, stop = _month_rows(chat, month)
+    counts = chat.month_token_ranking.iloc[start:min(stop, start + k)]
+    return counts.droplevel('month')
+
+
+def rising_topics(month, chat, k=10, window_months=3, min_count=3):
+    """The k tokens of a month whose share of the words grew most against the
+    `window_months` months before it; empty for the first month"""
+    chat = as_index(chat)
+    start, stop = _month_rows(chat, month)
+    rows = chat.trends(window_months, min_count).iloc[start:min(stop, start + k)]
+    return rows[rows['score'].notna()].drop(columns='month').reset_index(drop=True)
+
+
+def trending_topics_by_month(chat, k=10):
+    # {"YYYY-MM": {token: count}} of every month's k most used tokens
+    chat = as_index(chat)
+    counts = chat.month_token_ranking
+    return {_label(period): counts.iloc[start:min(stop, start + k)].droplevel('month').to_dict()
+            for period, (start, stop) in chat.month_bounds.items()}
+
+
+def rising_topics_by_month(chat, k=10, window_months=3, min_count=3):
+    # {"YYYY-MM": {token: score}} of every month's k most risen tokens
+    chat = as_index(chat)
+    trends = chat.trends(window_months, min_count)
+    result = {}
+    for period, (start, stop) in chat.month_bounds.items():
+        rows = trends.iloc[start:min(stop, start + k)]
+        rows = rows[rows['score'].notna()]
+        result[_label(period)] = dict(zip(rows['token'], rows['score'].round(3)))
     return result
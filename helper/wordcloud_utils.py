@@ -1,42 +1,34 @@
 # helper/wordcloud_utils.py
 
-from wordcloud import WordCloud
+import io
 import pandas as pd
-from collections import Counter
+from config.settings import ANALYSIS_CONFIG
+from .tokens import token_counts
 
-def create_wordcloud(selected_user, df):
-    with open('stop_hinglish.txt', 'r') as f:
-        stop_words = f.read()
+WORDCLOUD_SIZE = ANALYSIS_CONFIG['wordcloud_size']
+MAX_WORDCLOUD_WORDS = ANALYSIS_CONFIG['max_wordcloud_words']
 
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
 
-    temp = df[df['user'] != 'group_notification']
-    temp = temp[temp['message'] != '<Media omitted>']
+def create_wordcloud(selected_user, chat, size=WORDCLOUD_SIZE, max_words=MAX_WORDCLOUD_WORDS):
+    # wordcloud pulls in matplotlib, so it is only imported once a cloud is drawn
+    from wordcloud import WordCloud
 
-    def remove_stop_words(message):
-        words = [word for word in message.lower().split() if word not in stop_words]
-        return " ".join(words)
+    # Only the most frequent words can make it into the cloud, so only those are handed over
+    counts = token_counts(selected_user, chat).head(max_words)
 
-    wc = WordCloud(width=500, height=500, min_font_size=10, background_color='white')
-    temp['message'] = temp['message'].apply(remove_stop_words)
-    return wc.generate(temp['message'].str.cat(sep=" "))
+    wc = WordCloud(width=size, height=size, max_words=max_words, min_font_size=10, background_color='white')
+    return wc.generate_from_frequencies(counts.to_dict())
 
 
-def most_common_words(selected_user, df):
-    with open('stop_hinglish.txt', 'r') as f:
-        stop_words = f.read()
+def wordcloud_png(selected_user, chat, size=WORDCLOUD_SIZE, max_words=MAX_WORDCLOUD_WORDS):
+    # The rendered cloud as PNG bytes, which are far smaller to cache than the WordCloud and its layout
+    image = create_wordcloud(selected_user, chat, size, max_words).to_image()
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
 
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
 
-    temp = df[df['user'] != 'group_notification']
-    temp = temp[temp['message'] != '<Media omitted>']
+def most_common_words(selected_user, chat):
+    counts = token_counts(selected_user, chat).head(20)
 
-    words = []
-    for msg in temp['message']:
-        for word in msg.lower().split():
-            if word not in stop_words:
-                words.append(word)
-
-    return pd.DataFrame(Counter(words).most_common(20), columns=['word', 'count'])
+    return pd.DataFrame({'word': counts.index, 'count': counts.values})
@@ -73,7 +73,7 @@ def create_pdf(selected_user, num_messages, words, num_media, num_links, most_bu
     pdf.set_font("Arial", size=12)
 
     peak_day = daily_timeline.sort_values('message', ascending=False).iloc[0]
-    pdf.cell(0, 10, f"Highest Activity Date: {peak_day['only_date']}", ln=True)
+    pdf.cell(0, 10, f"Highest Activity Date: {peak_day['only_date'].date()}", ln=True)
     pdf.cell(0, 10, f"Messages on that day: {peak_day['message']}", ln=True)
 
     return pdf.output(dest='S').encode('latin-1')
@@ -1,68 +1,263 @@
-# preprocessor.py
+import codecs
 import re
 import pandas as pd
+from pandas.api.types import union_categoricals
+
+# One compiled pattern per export format. Each match is a message header and
+# the message body runs until the next match. Newer exports put a narrow
+# no-break space (U+202F) before AM/PM; \s matches it, so the text is scanned
+# as is and only the captured timestamps are normalised. iOS puts a
+# left-to-right mark (U+200E) before the header of attachment and system lines.
+IOS_PATTERN = re.compile(r'^\u200e?\[(?P<date>\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}:\d{2})\]\s?', re.MULTILINE)
+ANDROID_PATTERN = re.compile(r'^(?P<date>\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}(?:\s[APap][Mm])?)\s-\s', re.MULTILINE)
+
+# Pieces of a header timestamp, used to work out the export's date layout
+DATE_PARTS_PATTERN = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{2,4}),(\s+)\d{1,2}:\d{2}(:\d{2})?(\s*[APap][Mm])?$')
+# Timestamps looked at when detecting the layout
+DATE_SAMPLE_SIZE = 10_000
+
+# "user: text" on the first line of a body; bodies without it are notifications
+USER_PATTERN = re.compile(r'^(?P<user>[^\n]+?):\s(?P<message>.*)', re.DOTALL)
+
+# Bump whenever the frame produced by preprocess() changes, or a table stored
+# with it in the disk cache (e.g. sentiment scores); on-disk caches of parsed
+# chats are keyed on it
+PARSER_VERSION = 4
+
+# Category orders for the derived columns
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+PERIODS = ['00-1'] + [f"{hour}-{hour + 1}" for hour in range(1, 23)] + ['23-00']
+
+# Messages per emitted DataFrame; peak memory while parsing scales with this,
+# not with the size of the export.
+BATCH_SIZE = 100_000
+# Characters (or bytes, for binary sources) read from a file-like source at a time
+CHUNK_SIZE = 1 << 20
+
 
 def preprocess(data):
-    data = data.replace('\u202f', ' ')
-    
-    is_ios = data.strip().startswith('[')
-
-    if is_ios:
-        pattern = r'\[\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}:\d{2}\]'
-        
-        messages = re.split(pattern, data)[1:]
-        dates = re.findall(pattern, data)
-        
-        dates = [d.strip("[]") for d in dates]
-        
-        df = pd.DataFrame({'user_message': messages, 'message_date': dates})
-        df['message_date'] = pd.to_datetime(df['message_date'], format='mixed', dayfirst=True)
+    return preprocess_stream(data)
 
-    else:
-        pattern = r'\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}(?:\s[APap][Mm])?\s-\s'
-        
-        messages = re.split(pattern, data)[1:]
-        dates = re.findall(pattern, data)
-        
-        df = pd.DataFrame({'user_message': messages, 'message_date': dates})
-        df['message_date'] = df['message_date'].str.replace(' - ', '')
-        df['message_date'] = pd.to_datetime(df['message_date'], format='mixed', dayfirst=False)
 
-    df.rename(columns={'message_date': 'date'}, inplace=True)
+def preprocess_stream(source, batch_size=BATCH_SIZE, date_format=None):
+    batches = list(iter_preprocess(source, batch_size, date_format))
+    if not batches:
+        return _build_frame([], [], False)[0]
+
+    # A batch that contradicts the day and month order the earlier ones were
+    # read with switches it from there on (see _parse_dates). Those earlier
+    # batches are read again the other way round, as a parse of the whole
+    # export with the final order would have read them.
+    date_format = batches[-1].attrs['date_format']
+    if date_format is not None:
+        for batch in batches:
+            if batch.attrs['date_format'] is not None and batch.attrs['date_format'][:2] != date_format[:2]:
+                _swap_day_month(batch)
+                batch.attrs['date_format'] = date_format
+
+    # Every batch has its own user categories, merge them instead of letting
+    # concat fall back to an object column
+    users = union_categoricals([batch.pop('user') for batch in batches])
+    df = pd.concat(batches, ignore_index=True)
+    df.insert(1, 'user', users)
+    df.attrs['date_format'] = date_format
+    return df
 
-    users = []
-    message_texts = []
 
-    for message in df['user_message']:
-        entry = re.split(r'([\w\W]+?):\s', message)
-        
-        if len(entry) >= 3:
-            users.append(entry[1])
-            message_texts.append(" ".join(entry[2:]))
+def iter_preprocess(source, batch_size=BATCH_SIZE, date_format=None):
+    # `source` is either the whole chat as a string or a file-like object (text,
+    # binary or a memory map) that is read in CHUNK_SIZE pieces. The last, possibly incomplete, message
+    # of every chunk is carried over and re-scanned with the next one.
+    # `date_format` skips layout detection, e.g. when parsing the tail of an
+    # export whose layout is already known. A batch that contradicts the layout
+    # in use (see _parse_dates) switches it for itself and the batches after;
+    # batches already yielded keep theirs, preprocess_stream corrects them.
+    is_ios = None
+    pattern = None
+
+    dates = []
+    messages = []
+    carry = ''
+
+    for chunk in _read_chunks(source):
+        last = not chunk
+        text = carry + chunk
+
+        if pattern is None:
+            if not text.strip() and not last:
+                carry = text
+                continue
+            is_ios = _is_ios(text)
+            pattern = IOS_PATTERN if is_ios else ANDROID_PATTERN
+
+        prev = None
+        for match in pattern.finditer(text):
+            if prev is not None:
+                dates.append(prev.group('date'))
+                messages.append(text[prev.end():match.start()])
+                if len(messages) == batch_size:
+                    if date_format is None:
+                        date_format = detect_date_format(dates, dayfirst=is_ios)
+                    df, date_format = _build_frame(dates, messages, is_ios, date_format)
+                    yield df
+                    dates, messages = [], []
+            prev = match
+
+        if prev is None:
+            # Nothing before the first header belongs to a message, but keep
+            # the last partial line in case a header was cut in half.
+            carry = text[text.rfind('\n') + 1:]
+        elif last:
+            dates.append(prev.group('date'))
+            messages.append(text[prev.end():])
         else:
-            users.append('group_notification')
-            message_texts.append(entry[0])
+            carry = text[prev.start():]
+
+    if messages:
+        if date_format is None:
+            date_format = detect_date_format(dates, dayfirst=is_ios)
+        yield _build_frame(dates, messages, is_ios, date_format)[0]
+
+
+def _read_chunks(source):
+    # Always ends with an empty chunk so the caller can flush the last message.
+    # Bytes are decoded as they are read, so a binary file or memory map is
+    # never decoded in one piece; a character split between two reads is
+    # finished by the next one, and a leading byte order mark is dropped.
+    if isinstance(source, str):
+        yield source
+    else:
+        decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if not isinstance(chunk, str):
+                chunk = decoder.decode(chunk)
+            if chunk:
+                yield chunk
+        rest = decoder.decode(b'', final=True)
+        if rest:
+            yield rest
+    yield ''
+
+
+def _is_ios(text):
+    return text.lstrip().lstrip('\u200e').startswith('[')
 
-    df['user'] = users
-    df['message'] = message_texts
+
+def starts_with_message(text):
+    text = text.lstrip('\r\n')
+    return bool(IOS_PATTERN.match(text) or ANDROID_PATTERN.match(text))
+
+
+def detect_date_format(dates, dayfirst=False):
+    # Returns an explicit strptime format for the export, e.g. '%m/%d/%y, %I:%M %p',
+    # or None when the sample doesn't look like a known layout. Day vs month order
+    # is decided by any field above 12; `dayfirst` breaks the tie otherwise.
+    sample = _normalize_dates(dates[:DATE_SAMPLE_SIZE])
+    parts = sample.str.extract(DATE_PARTS_PATTERN)
+    if parts.empty or parts[0].isna().any():
+        return None
+
+    first = parts[0].astype(int)
+    second = parts[1].astype(int)
+    if (first > 12).any() and (second > 12).any():
+        return None
+    if (first > 12).any():
+        dayfirst = True
+    elif (second > 12).any():
+        dayfirst = False
+
+    layouts = parts[[2, 3, 4, 5]].fillna('')
+    year_digits = layouts[2].str.len().unique()
+    separators = layouts[3].unique()
+    has_seconds = (layouts[4] != '').unique()
+    meridiem = layouts[5].str.strip().ne('').unique()
+    if len(year_digits) != 1 or len(separators) != 1 or len(has_seconds) != 1 or len(meridiem) != 1:
+        return None
+    if year_digits[0] not in (2, 4):
+        return None
+
+    date_part = '%d/%m' if dayfirst else '%m/%d'
+    date_part += '/%y' if year_digits[0] == 2 else '/%Y'
+    time_part = '%I:%M' if meridiem[0] else '%H:%M'
+    if has_seconds[0]:
+        time_part += ':%S'
+    if meridiem[0]:
+        time_part += layouts[5].iloc[0][:-2] + '%p'
+
+    return f"{date_part},{separators[0]}{time_part}"
+
+
+def _normalize_dates(dates):
+    return pd.Series(dates, dtype=str).str.replace('\u202f', ' ', regex=False)
+
+
+def _parse_dates(dates, dayfirst, date_format):
+    # One vectorised pass with the detected format; only rows that don't fit it
+    # go through the slow per-element 'mixed' parser. Returns the dates and the
+    # format they were read with, which is the one to carry to the next batch.
+    if date_format is None:
+        return pd.to_datetime(dates, format='mixed', dayfirst=dayfirst), None
+
+    parsed = pd.to_datetime(dates, format=date_format, errors='coerce')
+    unparsed = parsed.isna()
+    if unparsed.any():
+        # The layout may have been guessed from batches whose days were all up
+        # to 12, read month first; a day above 12 in the month's place then
+        # doesn't fit. Re-detect from the rows that don't fit, keeping the
+        # current order on a tie, and read the batch again if that changes it.
+        redetected = detect_date_format(dates[unparsed].tolist(), dayfirst=date_format.startswith('%d'))
+        if redetected is not None and redetected != date_format:
+            date_format = redetected
+            parsed = pd.to_datetime(dates, format=date_format, errors='coerce')
+            unparsed = parsed.isna()
+    if unparsed.any():
+        parsed[unparsed] = pd.to_datetime(dates[unparsed], format='mixed', dayfirst=date_format.startswith('%d'))
+    return parsed, date_format
+
+
+def _build_frame(dates, messages, is_ios, date_format=None):
+    df = pd.DataFrame({'user_message': messages, 'message_date': _normalize_dates(dates)}, dtype=str)
+
+    df['message_date'], date_format = _parse_dates(df['message_date'], is_ios, date_format)
+    df.rename(columns={'message_date': 'date'}, inplace=True)
+
+    parts = df['user_message'].str.extract(USER_PATTERN)
+    df['user'] = parts['user'].fillna('group_notification').astype('category')
+    df['message'] = parts['message'].fillna(df['user_message'])
     df.drop(columns=['user_message'], inplace=True)
 
-    df['only_date'] = df['date'].dt.date
-    df['year'] = df['date'].dt.year
-    df['month_num'] = df['date'].dt.month
-    df['month'] = df['date'].dt.month_name()
-    df['day'] = df['date'].dt.day
-    df['day_name'] = df['date'].dt.day_name()
-    df['hour'] = df['date'].dt.hour
-
-    period = []
-    for hour in df['hour']:
-        if hour == 23:
-            period.append(f"{hour}-00")
-        elif hour == 0:
-            period.append("00-1")
-        else:
-            period.append(f"{hour}-{hour+1}")
-    df['period'] = period
+    _add_date_columns(df)
 
-    return df
+    # Kept with the frame so a cached chat's appended messages are read with
+    # the layout this part was read with (chat_cache.load_extension)
+    df.attrs['date_format'] = date_format
+    return df, date_format
+
+
+def _add_date_columns(df):
+    date = df['date'].dt
+    df['only_date'] = date.normalize()
+    df['year'] = date.year.astype('int16')
+    df['month_num'] = date.month.astype('int8')
+    df['month'] = pd.Categorical.from_codes(date.month.to_numpy() - 1, categories=MONTHS, ordered=True)
+    df['day'] = date.day.astype('int8')
+    df['day_name'] = pd.Categorical.from_codes(date.dayofweek.to_numpy(), categories=DAYS, ordered=True)
+    df['hour'] = date.hour.astype('int8')
+    df['period'] = pd.Categorical.from_codes(date.hour.to_numpy(), categories=PERIODS, ordered=True)
+
+
+def _swap_day_month(df):
+    # Re-reads the dates of a batch with day and month the other way round.
+    # The batch was read without a field above 12 in either place, so this is
+    # what parsing it with the other order gives; dates that don't exist the
+    # other way round are kept.
+    date = df['date']
+    swapped = pd.to_datetime(pd.DataFrame({'year': date.dt.year, 'month': date.dt.day, 'day': date.dt.month}),
+                             errors='coerce') + (date - date.dt.normalize())
+    df['date'] = swapped.astype(date.dtype).where(swapped.notna(), date)
+    _add_date_columns(df)
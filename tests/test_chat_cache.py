@@ -0,0 +1,50 @@
+import io
+import os
+
+import pytest
+
+import chat_cache
+import preprocessor
+from config.settings import DISK_CACHE_CONFIG
+from helper.chat_index import ChatIndex
+
+SAMPLE_CHAT = os.path.join(os.path.dirname(__file__), '..', 'sample_chat.txt')
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    monkeypatch.setitem(DISK_CACHE_CONFIG, 'directory', str(tmp_path))
+    monkeypatch.setitem(DISK_CACHE_CONFIG, 'enabled', True)
+
+
+def _cache(export):
+    file = io.BytesIO(export)
+    chat = ChatIndex(preprocessor.preprocess_stream(io.BytesIO(export)), digest=chat_cache.content_hash(file))
+    chat_cache.save(chat, file)
+    return chat
+
+
+def test_tail_is_read_with_the_layout_of_the_cached_part():
+    # Day first, but only days up to 12 at the start of the export
+    lines = [f"{i % 12 + 1:02d}/01/24, 10:{i % 60:02d} - a: message {i} " + 'x' * 40 for i in range(30_000)]
+    lines += [f"{i % 16 + 13:02d}/01/24, 11:{i % 60:02d} - b: message {i}" for i in range(1_000)]
+    export = ('\n'.join(lines) + '\n').encode()
+    assert _cache(export).df.attrs['date_format'].startswith('%d/%m')
+
+    file = io.BytesIO(export + b"03/02/24, 12:00 - a: tail\n")
+    chat = chat_cache.load_extension(file, chat_cache.content_hash(file))
+    assert len(chat) == len(lines) + 1
+    assert (chat.df['date'].iloc[-1].month, chat.df['date'].iloc[-1].day) == (2, 3)
+
+
+def test_save_keeps_only_built_tables():
+    chat = _cache(open(SAMPLE_CHAT, 'rb').read())
+    assert not chat.__dict__.keys() & {'tokens', 'token_counts', 'emoji_counts', 'polarity'}
+    assert 'token_counts' not in chat_cache.load(chat.digest).__dict__
+
+    counts = chat.token_counts
+    chat_cache.save_tables(chat)
+    loaded = chat_cache.load(chat.digest)
+    assert loaded.token_counts.equals(counts)
+    assert 'polarity' not in loaded.__dict__
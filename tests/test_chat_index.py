@@ -0,0 +1,17 @@
+import os
+
+import preprocessor
+from helper.chat_index import as_index
+
+SAMPLE_CHAT = os.path.join(os.path.dirname(__file__), '..', 'sample_chat.txt')
+
+
+def test_raw_frame_is_indexed_once():
+    df = preprocessor.preprocess(open(SAMPLE_CHAT, encoding='utf-8').read())
+    columns = list(df.columns)
+    index = as_index(df)
+    assert as_index(df) is index
+    assert list(df.columns) == columns
+
+    df['extra'] = 1
+    assert as_index(df) is not index
@@ -0,0 +1,12 @@
+import cli
+
+
+def test_output_names_disambiguate_clashing_file_names():
+    names = cli._output_names(['/exports/a/chat.txt', '/exports/b/chat.txt', '/exports/b/Chat.zip',
+                               '/exports/other.txt'])
+    assert names == {
+        '/exports/a/chat.txt': 'chat (a)',
+        '/exports/b/chat.txt': 'chat (b)',
+        '/exports/b/Chat.zip': 'Chat (b) 2',
+        '/exports/other.txt': 'other',
+    }
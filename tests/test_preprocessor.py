@@ -0,0 +1,44 @@
+import io
+
+import preprocessor
+
+# iOS puts a left-to-right mark before the header of attachment lines
+IOS_CHAT = (
+    "[12/03/24, 10:05:00] Alice: see this\n"
+    "\u200e[12/03/24, 10:06:00] Bob: \u200eimage omitted\n"
+    "[12/03/24, 10:07:00] Alice: nice\n"
+)
+
+
+def test_lrm_before_ios_header_starts_a_message():
+    df = preprocessor.preprocess(IOS_CHAT)
+    assert df['user'].tolist() == ['Alice', 'Bob', 'Alice']
+    assert df['message'].tolist() == ['see this\n', '\u200eimage omitted\n', 'nice\n']
+
+
+def test_lrm_before_first_ios_header():
+    df = preprocessor.preprocess('\u200e' + IOS_CHAT)
+    assert len(df) == 3
+    assert df['date'].iloc[0].day == 12
+
+
+def test_starts_with_message_after_lrm():
+    assert preprocessor.starts_with_message("\u200e[12/03/24, 10:06:00] Bob: \u200eimage omitted\n")
+
+
+def test_lrm_across_batches():
+    # Batched parsing sees the same messages as a parse of the whole text
+    whole = preprocessor.preprocess(IOS_CHAT * 50)
+    streamed = preprocessor.preprocess_stream(io.StringIO(IOS_CHAT * 50), batch_size=7)
+    assert streamed['message'].tolist() == whole['message'].tolist()
+
+
+def test_later_batch_corrects_the_day_month_order_of_earlier_ones():
+    # Day first, but the first batches only have days up to 12
+    chat = ("05/01/24, 10:00 - a: x\n06/01/24, 10:00 - a: y\n"
+            "13/01/24, 10:00 - a: z\n07/01/24, 10:00 - a: w\n")
+    whole = preprocessor.preprocess(chat)
+    streamed = preprocessor.preprocess_stream(io.StringIO(chat), batch_size=2)
+    assert whole['date'].dt.month.tolist() == [1, 1, 1, 1]
+    for column in whole.columns:
+        assert streamed[column].equals(whole[column])
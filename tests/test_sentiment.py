@@ -0,0 +1,24 @@
+import pytest
+
+from helper.sentiment import _lexicon_polarity
+
+textblob = pytest.importorskip('textblob')
+
+PHRASES = [
+    # negated
+    "not good", "not bad", "never happy", "no, good", "not a good movie", "I don't like it",
+    # intensified
+    "very good", "extremely bad", "very very nice", "not very good", "really not good", "not so bad",
+    # exclamation marks and emoticons
+    "good!", "so good!!!", "great :(", "never happy :)", "wow :-) :-(", "(!) fine",
+]
+
+
+@pytest.mark.parametrize('phrase', PHRASES)
+def test_lexicon_matches_textblob(phrase):
+    expected = textblob.TextBlob(phrase).sentiment.polarity
+    assert _lexicon_polarity([phrase])[0] == pytest.approx(expected)
+
+
+def test_negated_intensifier_lands_in_textblob_bucket():
+    assert _lexicon_polarity(["not very good"])[0] < 0
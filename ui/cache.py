@@ -0,0 +1,46 @@
+import streamlit as st
+
+import archives
+import chat_cache
+import helper
+import preprocessor
+from ui import profiling
+from chat_cache import content_hash
+from config.settings import CACHE_CONFIG
+
+
+@st.cache_resource(max_entries=CACHE_CONFIG['max_chats'], show_spinner="Reading chat...")
+def load_chat(digest, _file):
+    """Parse a chat export once per content hash; reruns get the same ChatIndex back"""
+    chat = profiling.call('chat_cache.load', chat_cache.load, digest)
+    if chat is not None:
+        return chat
+
+    with chat_cache.mapped(_file) as view:
+        # A re-export of a cached chat with newer messages appended only parses the new part
+        chat = profiling.call('chat_cache.load_extension', chat_cache.load_extension, view, digest)
+        if chat is None:
+            view.seek(0)
+            df = profiling.call('preprocessor.preprocess_stream', preprocessor.preprocess_stream, view)
+            chat = profiling.call('helper.ChatIndex', helper.ChatIndex, df, digest=digest)
+
+        chat_cache.save(chat, view)
+    return chat
+
+
+@st.cache_resource(max_entries=CACHE_CONFIG['max_chats'], show_spinner="Unpacking chats...")
+def load_archive(digest, _file, name):
+    """Parse every chat in a .zip or .gz once per archive hash: {member: ChatIndex}"""
+    return profiling.call('archives.load_members', archives.load_members, _file, name, digest)
+
+
+@st.cache_data(max_entries=CACHE_CONFIG['max_results'], show_spinner=False)
+def _cached_result(name, digest, params, options, _chat):
+    # Only runs on a cache miss, so the panel shows what was actually computed
+    return profiling.call(f'helper.{name}', getattr(helper, name), *params, _chat, **dict(options))
+
+
+def cached_call(func, *args, **kwargs):
+    """Call a helper as func(*args, chat, **kwargs), memoized on the chat hash and the other arguments"""
+    *params, chat = args
+    return _cached_result(func.__name__, chat.digest, tuple(params), tuple(sorted(kwargs.items())), chat)
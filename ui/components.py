@@ -1,18 +1,27 @@
+# Chart libraries are imported inside the render functions that draw with
+# them, so the upload page is up before plotly, matplotlib or seaborn load.
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import streamlit as st
-import plotly.express as px
-import plotly.graph_objects as go
-import matplotlib.pyplot as plt
-import seaborn as sns
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import chat_cache
 import helper
+from ui.cache import cached_call
+from ui import profiling
+from config.settings import ANALYSIS_CONFIG
 import pandas as pd
 
+@profiling.profiled
 def render_sidebar():
     with st.sidebar:
         st.markdown("## 📁 Instructions")
         st.info("1. Open WhatsApp Chat\n2. More Options -> Export Chat\n3. Choose **'Without Media'**\n4. Upload the `.txt` file here")
         st.markdown("---")
         st.caption("🔒 Your data is processed locally in your browser/server instance and is not stored.")
+        st.markdown("---")
+        st.checkbox("⏱️ Performance panel", key='profiling', help="Times every section and tracks its memory; makes the app a little slower while on")
 
+@profiling.profiled
 def render_header():
     st.markdown("""
     <div style="text-align: center; margin-bottom: 30px;">
@@ -21,9 +30,10 @@ def render_header():
     </div>
     """, unsafe_allow_html=True)
 
-def render_stats_section(selected_user, df):
+@profiling.profiled
+def render_stats_section(selected_user, chat):
     st.markdown("## 🔢 Top Statistics")
-    num_messages, words, num_media, num_links = helper.fetch_stats(selected_user, df)
+    num_messages, words, num_media, num_links = cached_call(helper.fetch_stats, selected_user, chat)
     
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -37,8 +47,9 @@ def render_stats_section(selected_user, df):
         
     st.markdown("---")
 
-def render_longest_message_section(df):
-    user, message, length = helper.longest_message_sender(df)
+@profiling.profiled
+def render_longest_message_section(chat):
+    user, message, length = cached_call(helper.longest_message_sender, chat)
     
     st.markdown("### 🏆 Longest Message Champion")
     st.markdown(f"""
@@ -51,10 +62,13 @@ def render_longest_message_section(df):
     with st.expander("📖 Read Full Message"):
         st.write(message)
 
-def render_most_active_users_section(selected_user, df):
+@profiling.profiled
+def render_most_active_users_section(selected_user, chat):
+    import plotly.express as px
+
     if selected_user == 'Overall':
         st.markdown("## 👑 Most Active Users")
-        x, new_df = helper.most_busy_users(df)
+        x, new_df = cached_call(helper.most_busy_users, chat)
         
         col1, col2 = st.columns([1.5, 1])
         
@@ -72,21 +86,25 @@ def render_most_active_users_section(selected_user, df):
             st.markdown("### 📊 User Breakdown")
             st.dataframe(new_df, hide_index=True, use_container_width=True)
 
-def render_text_analysis_section(selected_user, df):
+def _wordcloud(selected_user, chat):
+    # Rendered once per chat, user and size; reruns reuse the cached PNG
+    return cached_call(helper.wordcloud_png, selected_user, chat, size=ANALYSIS_CONFIG['wordcloud_size'])
+
+@profiling.profiled
+def render_text_analysis_section(selected_user, chat, wordcloud=None):
+    import plotly.express as px
+
     st.markdown("## 🔤 Text Analysis")
     col1, col2 = st.columns(2)
     
     with col1:
         st.markdown("### ☁️ Word Cloud")
-        df_wc = helper.create_wordcloud(selected_user, df)
-        fig, ax = plt.subplots(figsize=(6, 4))
-        ax.imshow(df_wc)
-        ax.axis('off')
-        st.pyplot(fig)
+        png = wordcloud if wordcloud is not None else _wordcloud(selected_user, chat)
+        st.image(png, use_container_width=True)
 
     with col2:
         st.markdown("### 🗣️ Most Common Words")
-        most_common_df = helper.most_common_words(selected_user, df)
+        most_common_df = cached_call(helper.most_common_words, selected_user, chat)
         
         fig = px.bar(
             most_common_df,
@@ -104,36 +122,73 @@ def render_text_analysis_section(selected_user, df):
         )
         st.plotly_chart(fig, use_container_width=True)
 
-def render_trending_topics_section(df):
+@profiling.profiled
+def render_trending_topics_section(chat, months=None):
+    import plotly.express as px
+
     st.markdown("## 🔥 Trending Topics")
-    topic_map = helper.trending_topics_by_month(df)
+    if months is None:
+        months = cached_call(helper.trend_months, chat)
     
-    if topic_map:
-        months = list(topic_map.keys())
+    if months:
         selected_month = st.selectbox("Select Month to View Trends", months, index=len(months) - 1)
         
         if selected_month:
-            topics = topic_map[selected_month]
-            words_df = pd.DataFrame(list(topics.items()), columns=['Word', 'Count'])
-            
-            fig = px.bar(
-                words_df,
-                x='Word',
-                y='Count',
-                title=f"Trends in {selected_month}",
-                color_discrete_sequence=['#25D366']
-            )
-            fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
-            st.plotly_chart(fig, use_container_width=True)
+            # Only the selected month is looked up; the per-month tables are built once per chat
+            top = ANALYSIS_CONFIG['max_trending_topics']
+            window = ANALYSIS_CONFIG['trend_window_months']
+            col1, col2 = st.columns(2)
+
+            with col1:
+                topics = cached_call(helper.top_topics, selected_month, chat, k=top)
+                words_df = pd.DataFrame({'Word': topics.index, 'Count': topics.values})
+                fig = px.bar(
+                    words_df,
+                    x='Word',
+                    y='Count',
+                    title=f"Trends in {selected_month}",
+                    color_discrete_sequence=['#25D366']
+                )
+                fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+                st.plotly_chart(fig, use_container_width=True)
+
+            with col2:
+                rising = cached_call(helper.rising_topics, selected_month, chat, k=top, window_months=window)
+                if rising.empty:
+                    st.info(f"Nothing stood out against the {window} months before {selected_month}.")
+                else:
+                    fig = px.bar(
+                        rising,
+                        x='token',
+                        y='score',
+                        hover_data={'count': True, 'share': ':.2%', 'baseline_share': ':.2%'},
+                        labels={'token': 'Word', 'score': 'Rise (log2 of share vs. before)'},
+                        title=f"Rising in {selected_month} vs. the {window} months before",
+                        color_discrete_sequence=['#128C7E']
+                    )
+                    fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+                    st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("No trending data available.")
 
-def render_conversation_starters_section(selected_user, df):
+@profiling.profiled
+def render_conversation_starters_section(selected_user, chat):
+    # Returns the column the languages table goes in (render_languages), which
+    # is drawn separately since detecting languages is slow
+    import plotly.express as px
+
     st.markdown("## 🗣️ Conversation Drivers")
     col1, col2 = st.columns([2, 1])
     
     with col1:
-        starter_counts = helper.conversation_starters(df)
+        gap = st.slider("Minutes of silence that end a conversation", 5, 240, 30, step=5, key='session_gap')
+        starter_counts = cached_call(helper.conversation_starters, chat, threshold_minutes=gap)
+        stats = cached_call(helper.session_stats, chat, threshold_minutes=gap)
+        first_reply = stats['median_first_reply_minutes']
+        st.caption(f"{stats['sessions']} conversations, typically {stats['median_messages']:.0f} messages "
+                   f"over {stats['median_minutes']:.0f} minutes; "
+                   + (f"the first reply comes after {first_reply:.0f} minutes" if first_reply is not None
+                      else "nobody replied within a conversation"))
         fig = px.pie(
             values=starter_counts.values,
             names=starter_counts.index,
@@ -145,14 +200,23 @@ def render_conversation_starters_section(selected_user, df):
 
     with col2:
         st.markdown("### 🌐 Languages")
-        lang_df = helper.detect_languages(selected_user, df)
-        st.dataframe(lang_df, use_container_width=True, hide_index=True)
+        st.checkbox("Detect on every message", key='detect_full', help="Slower on big chats; by default a random sample of messages is used")
+    return col2
+
+@profiling.profiled
+def render_languages(selected_user, chat, lang_df=None):
+    if lang_df is None:
+        lang_df = cached_call(helper.detect_languages, selected_user, chat, full=st.session_state.get('detect_full', False))
+    st.dataframe(lang_df, use_container_width=True, hide_index=True)
+
+@profiling.profiled
+def render_timeline_section(selected_user, chat):
+    import plotly.express as px
 
-def render_timeline_section(selected_user, df):
     st.markdown("## 📅 Activity Timeline")
     
     st.markdown("### Monthly Traffic")
-    timeline = helper.monthly_timeline(selected_user, df)
+    timeline = cached_call(helper.monthly_timeline, selected_user, chat)
     fig = px.line(
         timeline,
         x='time',
@@ -165,7 +229,7 @@ def render_timeline_section(selected_user, df):
     st.plotly_chart(fig, use_container_width=True)
 
     st.markdown("### Daily Traffic")
-    daily_timeline = helper.daily_timeline(selected_user, df)
+    daily_timeline = cached_call(helper.daily_timeline, selected_user, chat)
     fig = px.line(
         daily_timeline,
         x='only_date',
@@ -176,13 +240,16 @@ def render_timeline_section(selected_user, df):
     fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
     st.plotly_chart(fig, use_container_width=True)
 
-def render_activity_map_section(selected_user, df):
+@profiling.profiled
+def render_activity_map_section(selected_user, chat):
+    import plotly.express as px
+
     st.markdown("## ⏰ Activity Habits")
     col1, col2 = st.columns(2)
     
     with col1:
         st.markdown("### Busiest Days")
-        busy_day = helper.week_activity_map(selected_user, df)
+        busy_day = cached_call(helper.week_activity_map, selected_user, chat)
         fig = px.bar(
             x=busy_day.index,
             y=busy_day.values,
@@ -194,7 +261,7 @@ def render_activity_map_section(selected_user, df):
 
     with col2:
         st.markdown("### Busiest Months")
-        busy_month = helper.month_activity_map(selected_user, df)
+        busy_month = cached_call(helper.month_activity_map, selected_user, chat)
         fig = px.bar(
             x=busy_month.index,
             y=busy_month.values,
@@ -204,31 +271,38 @@ def render_activity_map_section(selected_user, df):
         fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
         st.plotly_chart(fig, use_container_width=True)
 
-def render_heatmaps_section(selected_user, df):
+@profiling.profiled
+def render_heatmaps_section(selected_user, chat):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     st.markdown("## 🔥 Activity Heatmaps")
     col1, col2 = st.columns(2)
     
     with col1:
         st.markdown("### Weekly Schedule")
-        user_heatmap = helper.activity_heatmap(selected_user, df)
+        user_heatmap = cached_call(helper.activity_heatmap, selected_user, chat)
         fig, ax = plt.subplots(figsize=(10, 6))
         sns.heatmap(user_heatmap, ax=ax, cmap="YlGnBu")
         st.pyplot(fig)
 
     with col2:
         st.markdown("### Hourly Habits")
-        active_hour_heatmap = helper.most_active_hour_heatmap(selected_user, df)
+        active_hour_heatmap = cached_call(helper.most_active_hour_heatmap, selected_user, chat)
         fig, ax = plt.subplots(figsize=(10, 6))
         sns.heatmap(active_hour_heatmap, ax=ax, cmap="Greens")
         st.pyplot(fig)
 
-def render_emoji_sentiment_section(selected_user, df):
+@profiling.profiled
+def render_emoji_sentiment_section(selected_user, chat, sentiments=None):
+    import plotly.express as px
+
     st.markdown("## 😄 Emotions & Emojis")
     col1, col2 = st.columns([1, 1])
     
     with col1:
         st.markdown("### Top Emojis")
-        emoji_df = helper.emoji_helper(selected_user, df)
+        emoji_df = cached_call(helper.emoji_helper, selected_user, chat)
         fig = px.pie(
             emoji_df.head(10),
             values='count',
@@ -240,7 +314,8 @@ def render_emoji_sentiment_section(selected_user, df):
 
     with col2:
         st.markdown("### Sentiment Analysis")
-        sentiments = helper.sentiment_analysis(selected_user, df)
+        if sentiments is None:
+            sentiments = cached_call(helper.sentiment_analysis, selected_user, chat)
         sentiment_df = pd.DataFrame(list(sentiments.items()), columns=['Sentiment', 'Count'])
         
         fig = px.bar(
@@ -257,13 +332,89 @@ def render_emoji_sentiment_section(selected_user, df):
         fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
         st.plotly_chart(fig, use_container_width=True)
 
-def render_analysis_sections(selected_user, df):
-    render_longest_message_section(df)
-    render_most_active_users_section(selected_user, df)
-    render_text_analysis_section(selected_user, df)
-    render_timeline_section(selected_user, df)
-    render_activity_map_section(selected_user, df)
-    render_heatmaps_section(selected_user, df)
-    render_emoji_sentiment_section(selected_user, df)
-    render_trending_topics_section(df)
-    render_conversation_starters_section(selected_user, df)
+def _build_word_tables(chat):
+    # The word cloud, the common words and the trends all count the same
+    # tokens; built by one thread so the others don't tokenize the chat again
+    chat.token_counts
+    chat.month_token_ranking
+
+
+def _after(ready, func, *args, **kwargs):
+    ready.result()
+    return func(*args, **kwargs)
+
+
+@profiling.profiled
+def render_analysis_sections(selected_user, chat):
+    # Every section gets its place on the page first. The slow NLP helpers run
+    # in background threads while the cheap sections are drawn, and each slow
+    # section is drawn as soon as its result comes in.
+    longest, active, text, timeline, activity, heatmaps, emotions, trending, drivers = (st.container() for _ in range(9))
+
+    ctx = get_script_run_ctx()
+    background = profiling.in_background
+    with ThreadPoolExecutor(max_workers=4, initializer=add_script_run_ctx, initargs=(None, ctx)) as pool:
+        full = st.session_state.get('detect_full', False)
+        words = pool.submit(background(profiling.profiled(_build_word_tables)), chat)
+        languages = pool.submit(background(cached_call), helper.detect_languages, selected_user, chat, full=full)
+        pending = {
+            pool.submit(background(cached_call), helper.sentiment_analysis, selected_user, chat):
+                (emotions, "sentiment", lambda result: render_emoji_sentiment_section(selected_user, chat, sentiments=result)),
+            pool.submit(background(_after), words, _wordcloud, selected_user, chat):
+                (text, "word cloud", lambda result: render_text_analysis_section(selected_user, chat, wordcloud=result)),
+            pool.submit(background(_after), words, cached_call, helper.trend_months, chat):
+                (trending, "trending topics", lambda result: render_trending_topics_section(chat, months=result)),
+        }
+        placeholders = {}
+        for future, (slot, label, _) in pending.items():
+            placeholders[future] = slot.empty()
+            placeholders[future].info(f"⏳ Working out the {label}...")
+
+        with longest:
+            render_longest_message_section(chat)
+        with active:
+            render_most_active_users_section(selected_user, chat)
+        with timeline:
+            render_timeline_section(selected_user, chat)
+        with activity:
+            render_activity_map_section(selected_user, chat)
+        with heatmaps:
+            render_heatmaps_section(selected_user, chat)
+        # Conversation starters and sessions are cheap; only the languages
+        # column next to them waits for its result
+        with drivers:
+            column = render_conversation_starters_section(selected_user, chat)
+        pending[languages] = (column, "languages", lambda result: render_languages(selected_user, chat, lang_df=result))
+        placeholders[languages] = column.empty()
+        placeholders[languages].info("⏳ Working out the languages...")
+
+        for future in as_completed(pending):
+            slot, label, draw = pending[future]
+            placeholders[future].empty()
+            with slot:
+                # One failing section shouldn't take the rest of the page with it
+                try:
+                    result = future.result()
+                except Exception as e:
+                    st.error(f"Couldn't work out the {label}: {e}")
+                else:
+                    draw(result)
+
+    # Everything is drawn; keep the tables the sections built for the next upload
+    chat_cache.save_tables(chat)
+
+def render_performance_panel():
+    records = profiling.records()
+    with st.expander("⏱️ Performance", expanded=True):
+        if not records:
+            st.caption("Nothing was computed in this run; everything came from the cache.")
+            return
+
+        df = pd.DataFrame(records)
+        df['name'] = ['\u2003' * depth + name for depth, name in zip(df['depth'], df['name'])]
+        df['peak_mb'] = (pd.to_numeric(df['peak_bytes']) / 2**20).round(1)
+        top_level = df.loc[df['depth'] == 0, 'seconds'].sum()
+        st.caption(f"{top_level:.2f}s in this run. Helpers only show up when their result wasn't cached yet. "
+                   "Peak memory isn't measured for work done in background threads or while it runs.")
+        st.dataframe(df[['name', 'seconds', 'rows', 'peak_mb', 'background']], hide_index=True, use_container_width=True)
+        st.download_button("⬇️ Download as JSON", profiling.to_json(), file_name="whatsstat_profile.json", mime="application/json")
@@ -0,0 +1,132 @@
+"""Per-section timings for the Performance panel.
+
+Wrapped calls record wall time, the rows they worked on and their peak traced
+allocation into this session's state. While the panel is switched off a
+wrapped call costs one session-state lookup; tracemalloc only runs while it is
+on. tracemalloc is process-wide, so peaks include other sessions' work.
+
+Work handed to background threads (see in_background) is timed but its peak
+memory isn't measured: tracemalloc keeps one peak for the whole process, so it
+can't be split between threads running at once. Calls made on any thread
+while background work runs get no peak either.
+"""
+import functools
+import json
+import threading
+import time
+import tracemalloc
+
+import streamlit as st
+
+# Nested profiled calls (a render function and the helpers it calls) on this thread
+_local = threading.local()
+
+# Background tasks running right now, in any session
+_background = 0
+_background_lock = threading.Lock()
+
+
+def enabled():
+    return st.session_state.get('profiling', False)
+
+
+def start_run():
+    """Call at the top of every script run: starts an empty list of records"""
+    st.session_state['profile'] = []
+    if enabled():
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+    elif tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def records():
+    return st.session_state.get('profile', [])
+
+
+def _rows(args, result):
+    # Rows of the chat (or of the selected user's part of it) a call worked on
+    from helper.chat_index import ChatIndex
+    for i, arg in enumerate(args):
+        if isinstance(arg, ChatIndex):
+            if i and isinstance(args[i - 1], str):
+                return len(arg.frame(args[i - 1]))
+            return len(arg)
+    for value in (result, *args):
+        if hasattr(value, 'shape'):
+            return len(value)
+    return None
+
+
+def call(name, func, *args, **kwargs):
+    """func(*args, **kwargs), recorded under `name` when profiling is on"""
+    if not enabled():
+        return func(*args, **kwargs)
+
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    # Added before the call so records stay in call order, callers first
+    record = {'name': name, 'depth': getattr(_local, 'base_depth', 0) + len(stack),
+              'background': getattr(_local, 'base_depth', None) is not None}
+    records().append(record)
+
+    # reset_peak() would clobber the peak of whatever runs on another thread
+    tracing = tracemalloc.is_tracing() and not _background
+    if tracing:
+        start_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    # [highest traced memory of nested calls, whose reset_peak hides it from this one]
+    frame = [0]
+    stack.append(frame)
+
+    result = None
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+        return result
+    finally:
+        record['seconds'] = round(time.perf_counter() - start, 6)
+        stack.pop()
+        record['peak_bytes'] = None
+        if tracing:
+            highest = max(tracemalloc.get_traced_memory()[1], frame[0])
+            record['peak_bytes'] = max(highest - start_memory, 0)
+            if stack:
+                stack[-1][0] = max(stack[-1][0], highest)
+        record['rows'] = _rows(args, result)
+
+
+def profiled(func):
+    """Decorator for render functions"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return call(func.__name__, func, *args, **kwargs)
+    return wrapper
+
+
+def in_background(func):
+    """Wrap work to be run on another thread. Call it on the thread handing the
+    work off: its records nest under the call running there, and none of the
+    calls overlapping it measure peak memory."""
+    if not enabled():
+        return func
+    base_depth = len(getattr(_local, 'stack', None) or [])
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global _background
+        with _background_lock:
+            _background += 1
+        _local.base_depth = base_depth
+        try:
+            return func(*args, **kwargs)
+        finally:
+            del _local.base_depth
+            with _background_lock:
+                _background -= 1
+    return wrapper
+
+
+def to_json():
+    return json.dumps(records(), indent=2)